@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+import os, sys, json, platform, statistics, tempfile, time
+import argparse as ap
+import shutil as su
+import subprocess as sp
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+import onsub
+import discover as dc
+import scheduler as sc
+from gentree import genTree
+
+def builtinPriorities(rc, markers=True):
+    priorities = {}
+    for section in ["git", "hg", "svn"]:
+        if markers: priorities[section] = (rc[section]["py:priority"], rc[section]["py:markers"])
+        else: priorities[section] = (getattr(onsub.od, section + "priority"), None)
+        continue
+    return priorities
+
+def discovery(args, root, paths, rc):
+    select = lambda path, names: onsub.selectSection(0, False, path, builtinPriorities(rc), names)
+    found = list(dc.walk(root, [], -1, True, select, args.walkers))
+    assert len(found) == len(paths), (len(found), len(paths))
+    return len(found)
+
+def selectMarkers(args, root, paths, rc):
+    priorities = builtinPriorities(rc)
+    for path, kind in paths: assert onsub.selectSection(0, False, path, priorities) == kind
+    return len(paths)
+
+def selectFunctions(args, root, paths, rc):
+    priorities = builtinPriorities(rc, False)
+    for path, kind in paths: assert onsub.selectSection(0, False, path, priorities) == kind
+    return len(paths)
+
+def substitution(args, root, paths, rc):
+    templates = {}
+    for path, kind in paths:
+        rcsection = onsub.rcPython(0, False, path, rc[kind])
+        if kind not in templates: templates[kind] = onsub.compileTemplate("{type} {sep} {wcrev}", rc[kind], 10)
+        assert onsub.substitute(templates[kind], rcsection, "%[", "%]", 10)
+        continue
+    return len(paths)
+
+def closePool(pool):
+    if hasattr(pool, "loop"): pool.loop.call_soon_threadsafe(pool.loop.stop)
+    elif hasattr(pool.pool, "shutdown"): pool.pool.shutdown()
+    else:
+        pool.pool.close()
+        pool.pool.join()
+        pass
+    return
+
+def scheduling(kind):
+    def bench(args, root, paths, rc):
+        pool = onsub.executors[kind](args.workers)
+        futures = sc.scheduler(0, 1, args.workers)
+        for path, section in paths:
+            futures.add(lambda path=path: pool.command(path, "true", "git", 0, False, False, path))
+            continue
+        results = onsub.waitFutures(0, False, False, {}, False, False, futures)
+        closePool(pool)
+        assert len(results) == len(paths) and all(ec == 0 for _, _, ec, _ in results)
+        return len(results)
+    return bench
+
+def pollFutures(futures):
+    results = []
+    while True:
+        nfutures = []
+        for future in futures:
+            if future.done(): results.append(future.result())
+            else: nfutures.append(future)
+            continue
+        if len(nfutures) == 0: break
+        futures = nfutures
+        continue
+    return results
+
+def blockFutures(futures): return onsub.waitFutures(0, False, False, {}, False, False, futures)
+
+def waiting(waiter):
+    def bench(args, root, paths, rc):
+        pool = onsub.executors["process"](args.workers)
+        futures = [pool.command(path, args.waitcmd, "git", 0, False, False, path) for path, section in paths]
+        results = waiter(futures)
+        closePool(pool)
+        assert len(results) == len(paths) and all(ec == 0 for _, _, ec, _ in results)
+        return len(results)
+    return bench
+
+def output(policy):
+    def bench(args, root, paths, rc):
+        cmd = "head -c {size} /dev/zero".format(size=args.outputsize)
+        tmpdir = tempfile.mkdtemp(prefix="onsubbench", dir=root)
+        ec, out = onsub.capture_output(cmd, None, "auto", policy[:2] + (tmpdir, None))
+        assert ec == 0 and len(out)
+        if type(out) == onsub.spilled: os.remove(out.name)
+        su.rmtree(tmpdir)
+        return args.outputsize
+    return bench
+
+benchmarks = {
+    "discovery": discovery,
+    "selection-markers": selectMarkers,
+    "selection-functions": selectFunctions,
+    "substitution": substitution,
+    "scheduling-process": scheduling("process"),
+    "scheduling-thread": scheduling("thread"),
+    "scheduling-async": scheduling("async"),
+    "waiting-poll": waiting(pollFutures),
+    "waiting-block": waiting(blockFutures),
+    "output-memory": output((0, 0)),
+    "output-spill": output((0, 1 << 20)),
+    "output-truncate": output((1 << 16, 1 << 20)),
+}
+
+def measure(function, args, root, paths, rc):
+    runs = []
+    for ii in range(args.repeat):
+        cpu, wall = time.process_time(), time.perf_counter()
+        items = function(args, root, paths, rc)
+        runs.append(dict(wall=time.perf_counter() - wall, cpu=time.process_time() - cpu, items=items))
+        continue
+    return dict(wall=statistics.median(run["wall"] for run in runs), cpu=statistics.median(run["cpu"] for run in runs), items=runs[0]["items"], runs=runs)
+
+def revision():
+    try: return sp.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=os.path.dirname(os.path.realpath(__file__)), stderr=sp.DEVNULL).decode().strip()
+    except (OSError, sp.CalledProcessError): return None
+    pass
+
+def compare(old, new):
+    for name, result in new["results"].items():
+        if name not in old["results"]: continue
+        before = old["results"][name]["wall"]
+        ratio = result["wall"] / before if before else 0.0
+        print("{name:>20}: {before:9.4f}s -> {after:9.4f}s ({ratio:6.2f}x)".format(name=name, before=before, after=result["wall"], ratio=ratio))
+        continue
+    return
+
+def main():
+    parser = ap.ArgumentParser(description="onsub benchmarks on a synthetic tree")
+    parser.add_argument("--repos", help="number of working copies", type=int, default=300)
+    parser.add_argument("--kind", help="working copy kinds", action="append", choices=["git", "hg", "svn"])
+    parser.add_argument("--depth", help="folder levels above the working copies", type=int, default=2)
+    parser.add_argument("--fanout", help="subfolders per level", type=int, default=5)
+    parser.add_argument("--decoys", help="folders without a working copy per level", type=int, default=2)
+    parser.add_argument("--real", help="create real working copies when the tools exist", action="store_true")
+    parser.add_argument("--workers", help="number of workers", type=int, default=os.cpu_count())
+    parser.add_argument("--walkers", help="number of discovery threads", type=int, default=8)
+    parser.add_argument("--waitcmd", help="command run in each folder by the waiting benchmarks", type=str, default="sleep 0.05")
+    parser.add_argument("--outputsize", help="bytes written by the output benchmarks", type=int, default=16 << 20)
+    parser.add_argument("--repeat", help="runs per benchmark", type=int, default=3)
+    parser.add_argument("--bench", help="benchmarks to run", action="append", choices=sorted(benchmarks))
+    parser.add_argument("--output", help="JSON file for results", type=str)
+    parser.add_argument("--compare", help="JSON file of earlier results to compare with", type=str)
+    args = parser.parse_args()
+    kinds = args.kind or ["git", "hg", "svn"]
+    root = tempfile.mkdtemp(prefix="onsubbench")
+    try:
+        paths = genTree(os.path.join(root, "tree"), args.repos, kinds, args.depth, args.fanout, args.decoys, 5, args.real)
+        paths = [(os.path.relpath(path, root), kind) for path, kind in paths]
+        rc = onsub.readConfig(None)
+        results = {}
+        with onsub.pd.pushd(root):
+            for name in args.bench or list(benchmarks):
+                results[name] = measure(benchmarks[name], args, "tree", paths, rc)
+                print("{name:>20}: wall {wall:9.4f}s cpu {cpu:9.4f}s".format(name=name, wall=results[name]["wall"], cpu=results[name]["cpu"]))
+                continue
+            pass
+        pass
+    finally: su.rmtree(root)
+    meta = dict(revision=revision(), python=platform.python_version(), platform=platform.platform(), cpus=os.cpu_count(), time=time.time(), args=vars(args))
+    data = dict(meta=meta, results=results)
+    if args.output:
+        with open(args.output, "w") as ff: json.dump(data, ff, indent=1)
+        pass
+    if args.compare:
+        with open(args.compare) as ff: compare(json.load(ff), data)
+        pass
+    return 0
+
+if __name__ == "__main__": sys.exit(main())
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+import os, sys
+import argparse as ap
+import itertools as it
+import shutil as su
+import subprocess as sp
+
+markers = {"git": ".git", "hg": ".hg", "svn": ".svn"}
+
+def folders(root, depth, fanout):
+    if depth <= 0:
+        yield root
+        return
+    for ii in range(fanout):
+        yield from folders(os.path.join(root, "d{ii:03d}".format(ii=ii)), depth - 1, fanout)
+        continue
+    return
+
+def makeRepo(path, kind, real, svnurl=None):
+    os.makedirs(path)
+    if real and kind == "git" and su.which("git"): sp.check_call(["git", "init", "-q", path])
+    elif real and kind == "hg" and su.which("hg"): sp.check_call(["hg", "init", path])
+    elif real and kind == "svn" and svnurl: sp.check_call(["svn", "checkout", "-q", svnurl, path])
+    else: os.makedirs(os.path.join(path, markers[kind]))
+    with open(os.path.join(path, "README"), "w") as ff: ff.write("{kind} {path}\n".format(kind=kind, path=path))
+    return
+
+def makeDecoy(path, files):
+    os.makedirs(os.path.join(path, "sub"))
+    for ii in range(files):
+        with open(os.path.join(path, "f{ii:03d}.txt".format(ii=ii)), "w") as ff: ff.write("decoy\n")
+        continue
+    return
+
+def genTree(root, repos, kinds=("git",), depth=0, fanout=10, decoys=0, files=5, real=False):
+    svnurl = None
+    if real and "svn" in kinds and su.which("svnadmin") and su.which("svn"):
+        svnroot = os.path.join(root, "_svnroot")
+        sp.check_call(["svnadmin", "create", svnroot])
+        svnurl = "file://" + os.path.abspath(svnroot)
+        pass
+    parents = list(folders(root, depth, fanout))
+    paths = []
+    for ii, kind in zip(range(repos), it.cycle(kinds)):
+        path = os.path.join(parents[ii % len(parents)], "repo{ii:05d}".format(ii=ii))
+        makeRepo(path, kind, real, svnurl)
+        paths.append((path, kind))
+        continue
+    for level in range(depth + 1):
+        for parent in folders(root, level, fanout):
+            if not os.path.isdir(parent): continue
+            for ii in range(decoys):
+                makeDecoy(os.path.join(parent, "decoy{ii:03d}".format(ii=ii)), files)
+                continue
+            continue
+        continue
+    return paths
+
+def main():
+    parser = ap.ArgumentParser(description="generates a synthetic tree of working copies")
+    parser.add_argument("root", help="folder to create", type=str)
+    parser.add_argument("--repos", help="number of working copies", type=int, default=300)
+    parser.add_argument("--kind", help="working copy kinds", action="append", choices=sorted(markers))
+    parser.add_argument("--depth", help="folder levels above the working copies", type=int, default=0)
+    parser.add_argument("--fanout", help="subfolders per level", type=int, default=10)
+    parser.add_argument("--decoys", help="folders without a working copy per level", type=int, default=0)
+    parser.add_argument("--files", help="files per decoy folder", type=int, default=5)
+    parser.add_argument("--real", help="create real working copies when the tools exist", action="store_true")
+    args = parser.parse_args()
+    if os.path.exists(args.root):
+        print('"{root}" already exists'.format(root=args.root), file=sys.stderr)
+        return 1
+    paths = genTree(args.root, args.repos, args.kind or ["git"], args.depth, args.fanout, args.decoys, args.files, args.real)
+    print("{n} working copies in {root}".format(n=len(paths), root=args.root))
+    return 0
+
+if __name__ == "__main__": sys.exit(main())
@@ -0,0 +1,108 @@
+import collections as cl
+import hashlib as hl
+import json, os, tempfile
+import gitstate as gs
+
+metadata = {
+    ".hg": ["dirstate", "bookmarks", "branch", "hgrc", "store/00changelog.i", "store/phaseroots"],
+    ".svn": ["wc.db"],
+}
+
+def stamp(filename):
+    try: st = os.stat(filename)
+    except OSError: return None
+    return [st.st_mtime_ns, st.st_size, st.st_ino]
+
+def gitFiles(path):
+    try: gitdir, commondir = gs.gitDirs(path)
+    except gs.unsupported: return []
+    files = [os.path.join(gitdir, name) for name in ("HEAD", "index", "logs/HEAD")]
+    files += [os.path.join(commondir, name) for name in ("packed-refs", "config")]
+    ref = gs.readFile(os.path.join(gitdir, "HEAD")) or ""
+    if ref.startswith("ref: "): files.append(os.path.join(commondir, ref[5:].strip()))
+    return files
+
+def fingerprint(path):
+    files = gitFiles(path) if os.path.exists(os.path.join(path, ".git")) else []
+    for marker, names in metadata.items():
+        if os.path.isdir(os.path.join(path, marker)): files += [os.path.join(path, marker, name) for name in names]
+        continue
+    if not len(files): return None
+    return [stamp(filename) for filename in files]
+
+def worktree(path, limit=1000):
+    stamps = (fingerprint(path) or []) + [stamp(path)]
+    mtimes = [value[0] for value in stamps if value]
+    try: entries = sorted(os.scandir(path), key=lambda entry: entry.name)
+    except OSError: entries = []
+    for entry in [entry for entry in entries if entry.name not in (".git", ".hg", ".svn")][:limit]:
+        try: mtime = entry.stat(follow_symlinks=False).st_mtime_ns
+        except OSError: mtime = None
+        stamps.append([entry.name, mtime])
+        if mtime: mtimes.append(mtime)
+        continue
+    return hl.sha1(json.dumps(stamps).encode()).hexdigest(), max(mtimes + [0]) / 1e9
+
+def key(path, section, cmd): return "\0".join([os.path.realpath(path), section, cmd])
+
+def writeJson(filename, data):
+    folder = os.path.dirname(os.path.abspath(filename))
+    fd, tmpname = tempfile.mkstemp(prefix=".onsub", dir=folder)
+    with os.fdopen(fd, "w") as ff: json.dump(data, ff)
+    os.replace(tmpname, filename)
+    return
+
+def readJson(filename):
+    try:
+        with open(filename) as ff: return json.load(ff)
+        pass
+    except (OSError, ValueError): return {}
+    pass
+
+class changeState:
+    def __init__(self, filename):
+        self.filename = filename
+        self.entries = readJson(filename).get("entries", {})
+        self.dirty = False
+        return
+    def changed(self, key, digest): return self.entries.get(key) != digest
+    def put(self, key, digest):
+        self.entries[key] = digest
+        self.dirty = True
+        return
+    def drop(self, key):
+        if self.entries.pop(key, None) is not None: self.dirty = True
+        return
+    def save(self):
+        if self.dirty: writeJson(self.filename, dict(version=1, entries=self.entries))
+        self.dirty = False
+        return
+    pass
+
+class resultCache:
+    def __init__(self, filename, size):
+        self.filename = filename
+        self.size = size
+        self.entries = cl.OrderedDict()
+        self.dirty = False
+        for key, fp, ec, out in readJson(filename).get("entries", []): self.entries[key] = (fp, ec, out)
+        return
+    def get(self, key, fp):
+        entry = self.entries.get(key)
+        if entry is None or entry[0] != fp: return None
+        self.entries.move_to_end(key)
+        self.dirty = True
+        return entry[1:]
+    def put(self, key, fp, ec, out):
+        self.entries[key] = (fp, ec, out)
+        self.entries.move_to_end(key)
+        self.dirty = True
+        return
+    def save(self):
+        if not self.dirty: return
+        while len(self.entries) > self.size: self.entries.popitem(last=False)
+        entries = [[key, fp, ec, out] for key, (fp, ec, out) in self.entries.items()]
+        writeJson(self.filename, dict(version=1, entries=entries))
+        self.dirty = False
+        return
+    pass
@@ -1,5 +1,7 @@
-import os
+import os, sys
+import subprocess as sp
 from colorama import Fore, Back, Style
+import gitstate as gs
 import pushd as pd
 
 colors = {
@@ -34,6 +36,15 @@ default.update(defdefault)
 if os.name =="nt": default.update(defwindows)
 else: default.update(deflinux)
 
+mirrorpy = os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), "mirror.py")
+
+def mirrorcommand(kind, debug, path, mirror, rest):
+    if os.path.exists(path): return None
+    assert len(rest) >= 1
+    cmd = '"{python}" "{mirrorpy}" --cmd "{{cmd}}" {kind} "{mirror}" {path} {rest}'.format(python=sys.executable, mirrorpy=mirrorpy, kind=kind, mirror=mirror, path=path, rest=" ".join(rest))
+    if debug: print(cmd)
+    return cmd
+
 def gitmakecommand(verbose, debug, path, *rest):
     if os.path.exists(path): return None
     assert len(rest) >= 1
@@ -42,17 +53,39 @@ def gitmakecommand(verbose, debug, path, *rest):
     if debug: print(cmd)
     return cmd
 
+def gitmirrorcommand(verbose, debug, path, mirror, *rest): return mirrorcommand("git", debug, path, mirror, rest[:1])
+
 def gitpriority(verbose, debug, path): return 4 if os.path.exists(".git") else 0
 
+def gitstate(reader, section, args):
+    def pyfunc(verbose, debug, path, noexec, *rest):
+        try: return 0, reader(".") + "\n"
+        except (gs.unsupported, OSError, UnicodeDecodeError, ValueError) as exc:
+            cmd = globals()[section].get("cmd", section)
+            if callable(cmd): cmd = cmd(verbose, debug, path)
+            cmd = "{cmd} {args}".format(cmd=cmd, args=args)
+            if debug: print('{path}: {exc}, running "{cmd}"'.format(path=path, exc=exc, cmd=cmd))
+            pass
+        proc = sp.run(cmd, shell=True, stdout=sp.PIPE, stderr=sp.STDOUT)
+        return proc.returncode, proc.stdout.decode("utf-8", "backslashreplace")
+    return pyfunc
+
 gitdefault = {
     "type": "echo '(git)' {cwd}",
     "ctype": "echo " + Fore.GREEN + Back.RESET + Style.BRIGHT + "'(git)'" + Fore.RESET + " {cwd}",
-    "py:priority": gitpriority, 
+    "py:priority": 4,
+    "py:markers": [".git"],
     "py:makecommand": gitmakecommand,
+    "py:mirrorcommand": gitmirrorcommand,
     "cmd": "git",
     "remote": "{cmd} remote get-url origin",
     "allremote": "{cmd} remote -v",
     "wcrev": "{cmd} rev-parse --verify --short HEAD",
+    "branch": "{cmd} rev-parse --abbrev-ref HEAD",
+    "py:remote": gitstate(gs.remote, "git", "remote get-url origin"),
+    "py:wcrev": gitstate(gs.wcrev, "git", "rev-parse --verify --short HEAD"),
+    "py:branch": gitstate(gs.branch, "git", "rev-parse --abbrev-ref HEAD"),
+    "py:cacheable": ["type", "ctype", "remote", "allremote", "wcrev", "branch", "py:remote", "py:wcrev", "py:branch"],
 }
 gitlinux = {}
 gitwindows = {}
@@ -74,15 +107,20 @@ def hgmakecommand(verbose, debug, path, *rest):
     if debug: print(cmd)
     return cmd
 
+def hgmirrorcommand(verbose, debug, path, mirror, *rest): return mirrorcommand("hg", debug, path, mirror, rest[:2])
+
 def hgpriority(verbose, debug, path): return 3 if os.path.exists(".hg") else 0
 
 hgdefault =  {
     "type": "echo '(hg)' {cwd}",
     "ctype": "echo " + Fore.CYAN + Back.RESET + Style.BRIGHT + "'(hg)'" + Fore.RESET + " {cwd}",
-    "py:priority": hgpriority,
+    "py:priority": 3,
+    "py:markers": [".hg"],
     "py:makecommand": hgmakecommand,
+    "py:mirrorcommand": hgmirrorcommand,
     "cmd": "hg",
     "wcrev": "{cmd} id -i",
+    "py:cacheable": ["type", "ctype", "remote", "allremote"],
 }
 hglinux = {
     "remote": '{cmd} paths default',
@@ -115,12 +153,14 @@ def svnpriority(verbose, debug, path): return 2 if os.path.exists(".svn") else 0
 svndefault = {
     "type": "echo '(svn)' {cwd}",
     "ctype": "echo " + Fore.MAGENTA + Back.RESET + Style.BRIGHT + "'(svn)'" + Fore.RESET + " {cwd}",
-    "py:priority": svnpriority,
+    "py:priority": 2,
+    "py:markers": [".svn"],
     "py:makecommand": svnmakecommand,
     "cmd": "svn",
     "remote": "{cmd} info --show-item url",
     "allremote": "{remote}",
-    "wcrev": "{cmd} info --show-item revision"
+    "wcrev": "{cmd} info --show-item revision",
+    "py:cacheable": ["type", "ctype", "remote", "allremote", "wcrev"],
 }
 svnlinux = {}
 svnwindows = {}
@@ -144,7 +184,7 @@ def allpriority(verbose, debug, path): return 1
 alldefault = {
     "type": "echo '(all)' {cwd}",
     "ctype": "{type}",
-    "py:priority": allpriority,
+    "py:priority": 1,
     "py:makefunction": allmakefunction,
 }
 alllinux = {}
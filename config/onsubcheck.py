@@ -1,4 +1,5 @@
 from colorama import Fore, Back, Style
+import vcscheck as vc
 
 gitlinux = { "put": '{cmd} commit -a -e -m "# $(pwd)"', }
 gitwindows = { "put": "{cmd} commit -a", }
@@ -13,6 +14,7 @@ gitnew = {
     "cleanup": "{cmd} reflog expire --expire=now --all",
     # commands
     "check": "gitcheck",
+    "py:check": vc.gitcheck,
     "stow": "{cmd} stash",
     "unstow": "{stash2wc} {sep} {mergetool} {sep} {index2wc} {sep} {cmd} stash clear",
     "upload": "{cmd} push",
@@ -34,6 +36,7 @@ hgnew = {
     "sync": "{cmd} pull",
     # commands
     "check": "hgcheck",
+    "py:check": vc.hgcheck,
     "stow": "{cmd} shelve",
     "unstow": "{cmd} unshelve",
     "upload": "{cmd} push",
@@ -50,6 +53,7 @@ else: hg.update(hglinux)
 svnnew = {
     # commands
     "check": "svncheck",
+    "py:check": vc.svncheck,
     "upload": "echo [unimplemented]",
     "download": "echo [unimplemented]",
     "put": "echo [unimplemented]",
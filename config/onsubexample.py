@@ -1,4 +1,9 @@
 arguments = [
+    # "--cache", ".onsubcache",
+    # "--cachesize", "10000",
+    # "--changedsince", "2026-10-18T09:00",
+    # "--changedsincelast",
+    # "--changedfile", "~/.onsubchanged",
     # "--chdir", ".",
     # "--color",
     # "--comment", "ignored",
@@ -10,11 +15,18 @@ arguments = [
     # "--dump",
     # "--dumpall",
     # "--enable", "all",
+    # "--executor", "process",
     # "--file", "subs.py",
+    # "--format", "text",
     # "--hashed",
     # "--ignore", ".hg", "--ignore", ".git", "--ignore", ".svn",
+    # "--index", ".onsubindex",
     # "--invert",
     # "--make",
+    # "--makeburst", "1",
+    # "--makeinflight", "0",
+    # "--maxoutput", "65536",
+    # "--mirror", "~/.onsubmirror",
     # "--nocolor",
     # "--noenable",
     # "--noexec",
@@ -22,20 +34,40 @@ arguments = [
     # "--nohashed",
     # "--noignore",
     # "--nomake",
+    # "--noprune",
     # "--norecurse",
+    # "--nostop",
+    # "--nostream",
+    # "--outputdir", "onsubout",
     # "--preconfig", "",
     # "--postconfig", "",
+    # "--prune",
+    # "--py:cacheable", "py:cacheable",
     # "--py:closebrace", "%]",
+    # "--py:concurrency", "py:concurrency",
     # "--py:enable", "py:enable",
     # "--py:makecommand", "py:makecommand",
     # "--py:makefunction", "py:makefunction",
+    # "--py:markers", "py:markers",
+    # "--py:mirrorcommand", "py:mirrorcommand",
     # "--py:openbrace", "%[",
     # "--py:priority", "py:priority",
+    # "--py:timeout", "py:timeout",
     # "--recurse",
+    # "--shell", "auto",
     # "--sleepmake", ".1",
+    # "--spill", "1048576",
     # "--sleepcommand", "0",
+    # "--stats",
+    # "--statsfile", "stats.json",
+    # "--statstop", "10",
+    # "--stop",
+    # "--stragglers", "0",
+    # "--stream",
     # "--suppress",
+    # "--timeout", "0",
     # "--verbose", "5",
+    # "--walkers", "8",
     # "--workers", "8",
 ]
 
@@ -0,0 +1,90 @@
+import os, json
+import concurrent.futures as cf
+
+class Index:
+    def __init__(self, filename, root, signature):
+        self.filename = filename
+        self.root = root
+        self.signature = signature
+        self.roots = {}
+        self.entries = {}
+        try:
+            with open(filename) as ff: data = json.load(ff)
+            pass
+        except (OSError, ValueError): data = {}
+        if type(data) == type({}) and data.get("signature") == signature: self.roots = data.get("roots", {})
+        self.old = self.roots.get(root, {})
+        return
+    def lookup(self, path, mtime):
+        try: omtime, section, dirs = self.old[path]
+        except (KeyError, ValueError): return None
+        if omtime != mtime: return None
+        return section, dirs
+    def record(self, path, mtime, section, dirs):
+        self.entries[path] = (mtime, section, dirs)
+        return
+    def save(self):
+        entries = dict(self.old)
+        entries.update(self.entries)
+        reachable = {}
+        stack = ["."]
+        while len(stack):
+            path = stack.pop()
+            if path not in entries: continue
+            reachable[path] = entries[path]
+            stack.extend(os.path.join(path, name) for name in entries[path][2])
+            continue
+        self.roots[self.root] = reachable
+        tmp = "{filename}.{pid}".format(filename=self.filename, pid=os.getpid())
+        with open(tmp, "w") as ff: json.dump({"signature": self.signature, "roots": self.roots}, ff)
+        os.replace(tmp, self.filename)
+        return
+    pass
+
+def scan(path, ignores, index=None):
+    try: mtime = os.stat(path).st_mtime_ns
+    except OSError: return None
+    if index:
+        hit = index.lookup(path, mtime)
+        if hit: return None, hit[1], mtime, hit
+        pass
+    names, dirs = [], []
+    try:
+        with os.scandir(path) as entries:
+            for entry in entries:
+                names.append(entry.name)
+                try: isdir = entry.is_dir()
+                except OSError: isdir = False
+                if isdir and entry.name not in ignores: dirs.append(entry.name)
+                continue
+            pass
+        pass
+    except OSError: return None
+    return names, dirs, mtime, None
+
+def walk(root, ignores, depth, prune, select, workers, index=None):
+    with cf.ThreadPoolExecutor(max_workers=workers) as pool:
+        stack = [(root, 0, pool.submit(scan, root, ignores, index))]
+        while len(stack):
+            path, level, future = stack.pop()
+            listing = future.result()
+            if listing is None: continue
+            names, dirs, mtime, hit = listing
+            if hit: section = hit[0]
+            else:
+                section = select(path, names)
+                if index: index.record(path, mtime, section, dirs)
+                pass
+            if section: yield path, section, None
+            if prune and section: continue
+            if depth >= 0 and level + 1 >= depth: continue
+            children = []
+            for name in dirs:
+                child = os.path.join(path, name)
+                children.append((child, level + 1, pool.submit(scan, child, ignores, index)))
+                continue
+            stack.extend(reversed(children))
+            continue
+        pass
+    if index: index.save()
+    return
@@ -0,0 +1,181 @@
+import os, re, struct
+
+class unsupported(Exception): pass
+
+def readFile(filename):
+    try:
+        with open(filename, encoding="utf-8") as ff: return ff.read()
+        pass
+    except (FileNotFoundError, NotADirectoryError, IsADirectoryError): return None
+    pass
+
+def gitDirs(path="."):
+    gitdir = os.path.join(path, ".git")
+    if os.path.isfile(gitdir):
+        mm = re.match(r"^gitdir: (.*)$", readFile(gitdir) or "", re.M)
+        if not mm: raise unsupported('unreadable "{gitdir}"'.format(gitdir=gitdir))
+        gitdir = os.path.join(path, mm.group(1).strip())
+        pass
+    if not os.path.isdir(gitdir): raise unsupported('no git directory in "{path}"'.format(path=path))
+    commondir = readFile(os.path.join(gitdir, "commondir"))
+    if commondir is None: return gitdir, gitdir
+    return gitdir, os.path.join(gitdir, commondir.strip())
+
+def unquote(value):
+    out, quoted, ii = [], False, 0
+    while ii < len(value):
+        cc = value[ii]
+        if cc == '"': quoted = not quoted
+        elif cc == "\\":
+            ii += 1
+            if ii == len(value): raise unsupported("line continuation")
+            out.append({"n": "\n", "t": "\t", "b": "\b"}.get(value[ii], value[ii]))
+            pass
+        elif cc in ";#" and not quoted: break
+        else: out.append(cc)
+        ii += 1
+        continue
+    if quoted: raise unsupported("unterminated quote")
+    return "".join(out).strip()
+
+def parseConfig(text):
+    config, section = {}, None
+    for line in text.splitlines():
+        line = line.strip()
+        if not len(line) or line[0] in ";#": continue
+        mm = re.match(r'^\[([-.\w]+)(?:\s+"((?:[^"\\]|\\.)*)")?\]\s*(?:[;#].*)?$', line)
+        if mm:
+            section = (mm.group(1).lower(), None if mm.group(2) is None else re.sub(r"\\(.)", r"\1", mm.group(2)))
+            continue
+        mm = re.match(r"^([A-Za-z][-A-Za-z0-9]*)\s*(?:=(.*))?$", line)
+        if not mm or section is None: raise unsupported("unparsable config line {line!r}".format(line=line))
+        value = "true" if mm.group(2) is None else unquote(mm.group(2))
+        config.setdefault(section + (mm.group(1).lower(),), []).append(value)
+        continue
+    return config
+
+def readConfig(commondir):
+    config = parseConfig(readFile(os.path.join(commondir, "config")) or "")
+    if any(key[0] in ("include", "includeif") for key in config): raise unsupported("config includes")
+    if any(key[0] == "url" for key in config): raise unsupported("url rewriting")
+    if len(config.get(("extensions", None, "objectformat"), [])): raise unsupported("object format")
+    if len(config.get(("extensions", None, "refstorage"), [])): raise unsupported("ref storage")
+    if len(config.get(("extensions", None, "worktreeconfig"), [])): raise unsupported("worktree config")
+    return config
+
+def userConfigs():
+    xdg = os.environ.get("XDG_CONFIG_HOME") or os.path.join(os.path.expanduser("~"), ".config")
+    return ["/etc/gitconfig", os.path.join(os.path.expanduser("~"), ".gitconfig"), os.path.join(xdg, "git", "config")]
+
+def checkUserConfigs(*names):
+    for filename in userConfigs():
+        text = readFile(filename) or ""
+        for name in names:
+            if re.search(name, text, re.I): raise unsupported('"{name}" in "{filename}"'.format(name=name, filename=filename))
+            continue
+        continue
+    return
+
+def readRef(gitdir, commondir, ref, depth=5):
+    if depth <= 0: raise unsupported("symbolic ref loop")
+    base = commondir if ref.startswith("refs/") and not re.match(r"^refs/(bisect|worktree|rewritten)/", ref) else gitdir
+    value = readFile(os.path.join(base, ref))
+    if value is not None:
+        value = value.strip()
+        if value.startswith("ref: "): return readRef(gitdir, commondir, value[5:].strip(), depth - 1)
+        if re.match(r"^[0-9a-f]{40}$", value): return ref, value
+        raise unsupported('unreadable ref "{ref}"'.format(ref=ref))
+    for line in (readFile(os.path.join(commondir, "packed-refs")) or "").splitlines():
+        if line.startswith("#") or line.startswith("^"): continue
+        fields = line.split(" ", 1)
+        if len(fields) == 2 and fields[1].strip() == ref: return ref, fields[0]
+        continue
+    return ref, None
+
+def head(path="."):
+    gitdir, commondir = gitDirs(path)
+    return readRef(gitdir, commondir, "HEAD")
+
+def packCount(objects):
+    count = 0
+    packdir = os.path.join(objects, "pack")
+    for name in os.listdir(packdir) if os.path.isdir(packdir) else []:
+        if not name.endswith(".idx"): continue
+        with open(os.path.join(packdir, name), "rb") as ff: header = ff.read(8 + 256 * 4)
+        if header[:8] != b"\377tOc\0\0\0\2": raise unsupported('pack index "{name}"'.format(name=name))
+        count += struct.unpack(">I", header[-4:])[0]
+        continue
+    return count
+
+def commonHex(one, two):
+    nn = 0
+    while nn < len(one) and nn < len(two) and one[nn] == two[nn]: nn += 1
+    return nn
+
+def packNeighbours(idx, sha):
+    binary = bytes.fromhex(sha)
+    with open(idx, "rb") as ff:
+        fanout = struct.unpack(">256I", ff.read(8 + 256 * 4)[8:])
+        lo, hi = fanout[binary[0] - 1] if binary[0] else 0, fanout[binary[0]]
+        end = hi
+        while lo < hi:
+            mid = (lo + hi) // 2
+            ff.seek(8 + 256 * 4 + mid * 20)
+            if ff.read(20) < binary: lo = mid + 1
+            else: hi = mid
+            continue
+        for pos in (lo - 1, lo, lo + 1):
+            if pos < (fanout[binary[0] - 1] if binary[0] else 0) or pos >= end: continue
+            ff.seek(8 + 256 * 4 + pos * 20)
+            yield ff.read(20).hex()
+            continue
+        pass
+    return
+
+def abbrevLength(commondir, config, sha):
+    objects = os.path.join(commondir, "objects")
+    if os.path.exists(os.path.join(objects, "info", "alternates")): raise unsupported("alternates")
+    abbrev = config.get(("core", None, "abbrev"), ["auto"])[-1].lower()
+    if abbrev in ("no", "false", "off"): return len(sha)
+    if abbrev != "auto":
+        if not re.match(r"^\d+$", abbrev): raise unsupported("core.abbrev")
+        length = min(len(sha), max(4, int(abbrev)))
+        pass
+    else: length = max(7, (max(1, packCount(objects)).bit_length() + 1) // 2)
+    others = []
+    loose = os.path.join(objects, sha[:2])
+    if os.path.isdir(loose): others.extend(sha[:2] + name for name in os.listdir(loose) if re.match(r"^[0-9a-f]{38}$", name))
+    packdir = os.path.join(objects, "pack")
+    for name in os.listdir(packdir) if os.path.isdir(packdir) else []:
+        if name.endswith(".idx"): others.extend(packNeighbours(os.path.join(packdir, name), sha))
+        continue
+    for other in others:
+        if other != sha: length = max(length, commonHex(sha, other) + 1)
+        continue
+    return min(length, len(sha))
+
+def wcrev(path="."):
+    gitdir, commondir = gitDirs(path)
+    ref, sha = readRef(gitdir, commondir, "HEAD")
+    if sha is None: raise unsupported('unborn ref "{ref}"'.format(ref=ref))
+    checkUserConfigs("abbrev", "include")
+    return sha[:abbrevLength(commondir, readConfig(commondir), sha)]
+
+def branch(path="."):
+    gitdir, commondir = gitDirs(path)
+    ref, sha = readRef(gitdir, commondir, "HEAD")
+    if sha is None: raise unsupported('unborn ref "{ref}"'.format(ref=ref))
+    if ref == "HEAD": return "HEAD"
+    if not ref.startswith("refs/heads/"): raise unsupported('ref "{ref}" outside refs/heads'.format(ref=ref))
+    name = ref[len("refs/heads/"):]
+    for other in (name, "refs/" + name, "refs/tags/" + name, "refs/remotes/" + name, "refs/remotes/" + name + "/HEAD"):
+        if readRef(gitdir, commondir, other)[1] is not None: raise unsupported('ambiguous ref "{name}"'.format(name=name))
+        continue
+    return name
+
+def remote(path=".", name="origin"):
+    gitdir, commondir = gitDirs(path)
+    checkUserConfigs("insteadof", "include")
+    urls = readConfig(commondir).get(("remote", name, "url"))
+    if not urls: raise unsupported('no url for remote "{name}"'.format(name=name))
+    return urls[0]
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+import os, re, sys, time
+import argparse as ap
+import contextlib as cl
+import hashlib as hl
+import shlex as sl
+import shutil as su
+import subprocess as sp
+if os.name == "nt": import msvcrt
+else: import fcntl
+
+def mirrorName(url):
+    base = re.sub(r"[^-\w.]+", "_", os.path.basename(url.rstrip("/")) or "repo")
+    return "{base}-{digest}".format(base=base[:40], digest=hl.sha1(url.encode()).hexdigest()[:12])
+
+def lock(ff):
+    if os.name != "nt": return fcntl.flock(ff.fileno(), fcntl.LOCK_EX)
+    ff.seek(0)
+    while True:
+        try: return msvcrt.locking(ff.fileno(), msvcrt.LK_LOCK, 1)
+        except OSError: continue
+        pass
+    return
+
+def unlock(ff):
+    if os.name != "nt": return fcntl.flock(ff.fileno(), fcntl.LOCK_UN)
+    ff.seek(0)
+    return msvcrt.locking(ff.fileno(), msvcrt.LK_UNLCK, 1)
+
+@cl.contextmanager
+def locked(filename):
+    with open(filename, "a+") as ff:
+        lock(ff)
+        try: yield ff
+        finally: unlock(ff)
+        pass
+    return
+
+def run(argv):
+    print(" ".join(sl.quote(arg) for arg in argv), flush=True)
+    try: return sp.call(argv)
+    except OSError as exc:
+        print("{prog}: {exc}".format(prog=argv[0], exc=exc), flush=True)
+        return 127
+    pass
+
+def gitUpdate(cmd, url, mirror):
+    if os.path.isdir(mirror): return run(cmd + ["-C", mirror, "-c", "gc.auto=0", "fetch", "--prune", "--quiet", "origin"])
+    return run(cmd + ["clone", "--mirror", "--quiet", url, mirror])
+
+def gitClone(cmd, url, mirror, path, rev):
+    reference = ["--reference", mirror, "--dissociate"] if os.path.isdir(mirror) else []
+    return run(cmd + ["clone"] + reference + [url, path])
+
+def hgUpdate(cmd, url, mirror):
+    if os.path.isdir(mirror): return run(cmd + ["pull", "--quiet", "-R", mirror, url])
+    return run(cmd + ["clone", "--quiet", "-U", url, mirror])
+
+def hgClone(cmd, url, mirror, path, rev):
+    if not os.path.isdir(mirror): return run(cmd + ["clone", url, path] + (["-r", rev] if rev else []))
+    ec = run(cmd + ["clone", mirror, path] + (["-r", rev] if rev else []))
+    if ec: return ec
+    with open(os.path.join(path, ".hg", "hgrc"), "w") as ff: ff.write("[paths]\ndefault = {url}\n".format(url=url))
+    return 0
+
+kinds = {
+    "git": (gitUpdate, gitClone),
+    "hg": (hgUpdate, hgClone),
+}
+
+def update(kind, cmd, url, folder):
+    os.makedirs(folder, exist_ok=True)
+    mirror = os.path.join(folder, mirrorName(url))
+    stampfile = mirror + ".stamp"
+    requested = time.time()
+    with locked(mirror + ".lock"):
+        if os.path.exists(stampfile) and os.path.getmtime(stampfile) >= requested: return mirror
+        tmpname = mirror + ".tmp"
+        if os.path.isdir(mirror): ec = kinds[kind][0](cmd, url, mirror)
+        else:
+            su.rmtree(tmpname, ignore_errors=True)
+            ec = kinds[kind][0](cmd, url, tmpname)
+            if ec == 0: os.rename(tmpname, mirror)
+            else: su.rmtree(tmpname, ignore_errors=True)
+            pass
+        if ec == 0:
+            with open(stampfile, "w"): pass
+            pass
+        pass
+    return mirror
+
+def main():
+    parser = ap.ArgumentParser(description="clones through a locked local mirror of each url")
+    parser.add_argument("--cmd", help="version control command", type=str)
+    parser.add_argument("kind", help="version control kind", choices=sorted(kinds))
+    parser.add_argument("mirror", help="mirror cache folder")
+    parser.add_argument("path", help="folder to clone into")
+    parser.add_argument("url", help="upstream url")
+    parser.add_argument("rev", help="revision to clone", nargs="?")
+    args = parser.parse_args()
+    cmd = sl.split(args.cmd or args.kind)
+    mirror = update(args.kind, cmd, args.url, os.path.join(args.mirror, args.kind))
+    return kinds[args.kind][1](cmd, args.url, mirror, args.path, args.rev)
+
+if __name__ == "__main__": sys.exit(main())
@@ -1,14 +1,32 @@
 #!/usr/bin/env python3
-import os, signal, sys, time
+import os, json, re, signal, string, sys, tempfile, time
+import datetime as dt
 import argparse as ap
+import atexit
+import asyncio as aio
+import codecs as cd
+import cProfile as cp
+import collections.abc as cabc
+import concurrent.futures as cf
+import functools as ft
+import shlex as sl
+import shutil as su
+import traceback as tb
 import subprocess as sp
+import mmap
 import multiprocessing as mp
+import threading as th
 import colorama as ca
 from colorama import Fore, Back, Style
 import pebble as pb
+import pstats as pt
 import runpy as rp
 import hashlib as hl
 import pushd as pd
+import cache as ch
+import discover as dc
+import scheduler as sc
+import stats as st
 import config.onsubbuiltin as od
 
 def eprint(*args, **kwargs):
@@ -20,49 +38,411 @@ def error(code, *args, **kwargs):
     sys.exit(code)
     return
 
-def substitute(st, rc, openbrace, closebrace, count):
+def expand(st, rc, count):
     while count >= 0:
-        try: nst = st.format(**rc)
+        if "{" not in st and "}" not in st: break
+        try: nst = st.format_map(rc)
         except ValueError as exc: error(256 - 9, "Invalid substitution string: {exc}".format(exc=exc))
         except KeyError as exc: error(256 - 10, "Substitution not found: {exc}".format(exc=exc))
         if nst == st: break
         st = nst
         count -= 1
         continue
-    return st.replace(openbrace, "{").replace(closebrace, "}")
+    return st
+
+def substitute(st, rc, openbrace, closebrace, count):
+    return expand(st, rc, count).replace(openbrace, "{").replace(closebrace, "}")
 
-def check_call(cmd):
-    try: ec = sp.check_call(cmd, shell=True)
+def substFields(st):
+    try: return [re.split(r"[.\[]", name)[0] for _, name, _, _ in string.Formatter().parse(st) if name]
+    except ValueError: return []
+
+def substCycle(keys, rc, chain, done):
+    for key in keys:
+        if key in chain: return chain[chain.index(key):] + [key]
+        if key in done or key not in rc or type(rc[key]) != type(""): continue
+        cycle = substCycle(substFields(rc[key]), rc, chain + [key], done)
+        if cycle: return cycle
+        done.add(key)
+        continue
+    return None
+
+def compileTemplate(st, rc, count):
+    cycle = substCycle(substFields(st), rc, [], set())
+    if cycle: error(256 - 12, "Substitution cycle: {cycle}".format(cycle=" -> ".join(cycle)))
+    return expand(st, rcTemplate(rc), count)
+
+shellchars = set("|&;<>()$`\\*?[]{}~\n")
+shellwords = set(["!", ".", ":", "[", "alias", "break", "case", "cd", "command", "continue", "echo", "eval", "exec", "exit", "export", "for", "function", "if", "local", "printf", "pwd", "read", "readonly", "return", "set", "shift", "source", "test", "then", "times", "trap", "type", "ulimit", "umask", "unalias", "unset", "until", "wait", "while"])
+
+@ft.lru_cache(maxsize=1024)
+def shellSplit(cmd, shell="auto"):
+    if shell == "always" or shell is True: return None
+    if shell == "auto":
+        if os.name == "nt" or any(ch in shellchars for ch in cmd): return None
+        pass
+    try: argv = sl.split(cmd)
+    except ValueError: return None
+    if len(argv) == 0: return None
+    if shell == "auto":
+        if "=" in argv[0] or argv[0] in shellwords or any(arg[:1] == "#" for arg in argv): return None
+        if os.sep in argv[0] and not os.path.isabs(argv[0]): return None
+        if not su.which(argv[0]): return None
+        pass
+    return tuple(argv)
+
+def execError(argv, exc):
+    if type(exc) == PermissionError: return 126, "{prog}: Permission denied".format(prog=argv[0])
+    return 127, "{prog}: not found".format(prog=argv[0])
+
+def check_call(cmd, shell="auto"):
+    argv = shellSplit(cmd, shell)
+    try: ec = sp.check_call(list(argv) if argv else cmd, shell=argv is None)
     except sp.CalledProcessError as exc: ec = exc.returncode
+    except OSError as exc: ec = execError(argv, exc)[0]
     return ec, "{cmd}".format(cmd=cmd)
 
-def check_output(cmd, stderr=sp.STDOUT):
+def check_output(cmd, stderr=sp.STDOUT, cwd=None, shell="auto"):
+    argv = shellSplit(cmd, shell)
     try:
-        out = sp.check_output(cmd, shell=True, stderr=stderr).decode("utf-8", "backslashreplace")
+        out = sp.check_output(list(argv) if argv else cmd, shell=argv is None, stderr=stderr, cwd=cwd).decode("utf-8", "backslashreplace")
         ec = 0
         pass
     except sp.CalledProcessError as exc:
         out = exc.output.strip().decode("utf-8", "backslashreplace")
         ec = exc.returncode
         pass
+    except OSError as exc: ec, out = execError(argv, exc)
+    return ec, out
+
+class spilled:
+    def __init__(self, name, size):
+        self.name = name
+        self.size = size
+        return
+    def __len__(self): return self.size
+    def __str__(self): return "[{size} bytes in {name}]".format(size=self.size, name=self.name)
+    pass
+
+class outputCapture:
+    def __init__(self, policy=None):
+        self.maxoutput, self.spill, self.tmpdir, self.keep = policy or (0, 0, None, None)
+        self.head = bytearray()
+        self.tail = bytearray()
+        self.total = 0
+        self.file = self.name = self.keepfile = None
+        if self.keep:
+            os.makedirs(os.path.dirname(self.keep), exist_ok=True)
+            self.keepfile = open(self.keep, "wb")
+            pass
+        return
+    def write(self, data):
+        self.total += len(data)
+        if self.keepfile: self.keepfile.write(data)
+        if self.maxoutput:
+            half = self.maxoutput // 2
+            room = half - len(self.head)
+            if room > 0:
+                self.head += data[:room]
+                data = data[room:]
+                pass
+            self.tail += data
+            if len(self.tail) > self.maxoutput - half: del self.tail[:len(self.tail) - (self.maxoutput - half)]
+            return
+        if self.file:
+            self.file.write(data)
+            return
+        self.head += data
+        if self.spill and self.tmpdir and len(self.head) > self.spill:
+            fd, self.name = tempfile.mkstemp(dir=self.tmpdir, suffix=".out")
+            self.file = os.fdopen(fd, "wb")
+            self.file.write(self.head)
+            self.head = bytearray()
+            pass
+        return
+    def result(self, ec, keep=True):
+        if self.keepfile: self.keepfile.close()
+        if self.file:
+            self.file.close()
+            if keep: return spilled(self.name, self.total)
+            os.remove(self.name)
+            return ""
+        if not keep: return ""
+        elided = self.total - len(self.head) - len(self.tail)
+        if elided: raw = self.head.rstrip(b"\n") + "\n[... {elided} bytes elided ...]\n".format(elided=elided).encode() + self.tail.lstrip(b"\n")
+        else: raw = self.head + self.tail
+        return (bytes(raw).strip() if ec else bytes(raw)).decode("utf-8", "backslashreplace")
+    pass
+
+newgroup = dict(creationflags=sp.CREATE_NEW_PROCESS_GROUP) if os.name == "nt" else dict(start_new_session=True)
+def groupArgs(timeout): return newgroup if timeout else {}
+groups = set()
+
+def killGroup(proc):
+    try:
+        if os.name == "nt": proc.kill()
+        else: os.killpg(proc.pid, signal.SIGKILL)
+        pass
+    except OSError: pass
+    return
+
+def reapGroups():
+    for proc in list(groups): killGroup(proc)
+    return
+
+class watchdog:
+    def __init__(self, proc, timeout, loop=None):
+        self.proc = proc
+        self.timeout = timeout
+        self.expired = False
+        self.timer = None
+        if not timeout: return
+        groups.add(proc)
+        if loop: self.timer = loop.call_later(timeout, self.expire)
+        else:
+            self.timer = th.Timer(timeout, self.expire)
+            self.timer.daemon = True
+            self.timer.start()
+            pass
+        return
+    def expire(self):
+        self.expired = True
+        killGroup(self.proc)
+        return
+    def result(self, ec, out):
+        groups.discard(self.proc)
+        if self.timer: self.timer.cancel()
+        if not self.expired: return ec, out
+        if type(out) == type(""): out = out + "\n[timed out after {timeout}s]".format(timeout=self.timeout) if out else "[timed out after {timeout}s]".format(timeout=self.timeout)
+        return 124, out
+    pass
+
+def capture_output(cmd, cwd=None, shell="auto", policy=None, timeout=0):
+    argv = shellSplit(cmd, shell)
+    try: proc = sp.Popen(list(argv) if argv else cmd, shell=argv is None, stdout=sp.PIPE, stderr=sp.STDOUT, cwd=cwd, **groupArgs(timeout))
+    except OSError as exc: return execError(argv, exc)
+    guard = watchdog(proc, timeout)
+    capture = outputCapture(policy)
+    try:
+        while True:
+            data = proc.stdout.read1(1 << 16)
+            if not data: break
+            capture.write(data)
+            continue
+        ec = proc.wait()
+        pass
+    except BaseException:
+        guard.expire()
+        raise
+    return guard.result(ec, capture.result(ec))
+
+def stream_output(cmd, tag, cwd=None, shell="auto", policy=None, timeout=0):
+    argv = shellSplit(cmd, shell)
+    try: proc = sp.Popen(list(argv) if argv else cmd, shell=argv is None, stdout=sp.PIPE, stderr=sp.STDOUT, cwd=cwd, **groupArgs(timeout))
+    except OSError as exc:
+        ec, out = execError(argv, exc)
+        streamline(tag, out)
+        return ec, out
+    guard = watchdog(proc, timeout)
+    capture = outputCapture(policy)
+    try:
+        for line in proc.stdout:
+            streamline(tag, line.decode("utf-8", "backslashreplace"))
+            capture.write(line)
+            continue
+        ec = proc.wait()
+        pass
+    except BaseException:
+        guard.expire()
+        raise
+    ec, out = guard.result(ec, capture.result(ec, ec != 0))
+    if ec == 124: streamline(tag, "[timed out after {timeout}s]".format(timeout=timeout))
     return ec, out
 
-def work(path, cmd, section, verbose, debug, noexec):
+def streamline(tag, line):
+    sys.stdout.write("{tag} {line}".format(tag=tag, line=line.rstrip("\r\n") + "\n"))
+    sys.stdout.flush()
+    return
+
+def streamlines(tag, out):
+    for line in out.strip().splitlines(): streamline(tag, line)
+    return
+
+def work(path, cmd, section, verbose, debug, noexec, stream=None, cwd=None, shell="auto", policy=None, timeout=0):
     pheader = "{path} ({section})".format(path=path, section=section)
     cheader = "{cmd}".format(cmd=cmd)
     if verbose >= 4: print(pheader, cheader)
-    if noexec: return pheader, cheader, 0, "[noexec] {cmd}".format(cmd=cmd)
-    ec, out = check_output(cmd)
+    if noexec:
+        out = "[noexec] {cmd}".format(cmd=cmd)
+        if stream: streamlines(stream, out)
+        return pheader, cheader, 0, out
+    if stream: ec, out = stream_output(cmd, stream, cwd, shell, policy, timeout)
+    else: ec, out = capture_output(cmd, cwd, shell, policy, timeout)
     if debug:
         print(pheader, cheader, "=", ec)
         print(out)
         pass
     return pheader, cheader, ec, out
 
-def cdwork(path, cmd, section, verbose, debug, noexec, cd):
-    with pd.pushd(cd): rv = work(path, cmd, section, verbose, debug, noexec)
+def cdwork(path, cmd, section, verbose, debug, noexec, cd, stream=None, shell="auto", policy=None, timeout=0):
+    with pd.pushd(cd): rv = work(path, cmd, section, verbose, debug, noexec, stream, None, shell, policy, timeout)
     return rv
 
+async def awork(path, cmd, section, verbose, debug, noexec, stream, cwd, shell, policy, timeout, semaphore):
+    pheader = "{path} ({section})".format(path=path, section=section)
+    cheader = "{cmd}".format(cmd=cmd)
+    async with semaphore:
+        if verbose >= 4: print(pheader, cheader)
+        if noexec:
+            out = "[noexec] {cmd}".format(cmd=cmd)
+            if stream: streamlines(stream, out)
+            return pheader, cheader, 0, out
+        argv = shellSplit(cmd, shell)
+        try:
+            if argv: proc = await aio.create_subprocess_exec(*argv, stdout=sp.PIPE, stderr=sp.STDOUT, cwd=cwd, **groupArgs(timeout))
+            else: proc = await aio.create_subprocess_shell(cmd, stdout=sp.PIPE, stderr=sp.STDOUT, cwd=cwd, **groupArgs(timeout))
+            pass
+        except OSError as exc:
+            ec, out = execError(argv, exc)
+            if stream: streamline(stream, out)
+            return pheader, cheader, ec, out
+        guard = watchdog(proc, timeout, aio.get_running_loop())
+        capture = outputCapture(policy)
+        partial = b""
+        while True:
+            data = await proc.stdout.read(1 << 16)
+            if not data: break
+            capture.write(data)
+            if stream:
+                lines = (partial + data).split(b"\n")
+                partial = lines.pop()
+                for line in lines: streamline(stream, line.decode("utf-8", "backslashreplace"))
+                pass
+            continue
+        if stream and partial: streamline(stream, partial.decode("utf-8", "backslashreplace"))
+        ec = await proc.wait()
+        ec, out = guard.result(ec, capture.result(ec, ec != 0 or not stream))
+        if stream and ec == 124: streamline(stream, "[timed out after {timeout}s]".format(timeout=timeout))
+        pass
+    if debug:
+        print(pheader, cheader, "=", ec)
+        print(out)
+        pass
+    return pheader, cheader, ec, out
+
+pyconfig = None
+def pyinit(configfile, preconfigs, postconfigs, grouped=False):
+    global pyconfig
+    if pyconfig is None: pyconfig = readConfig(configfile, preconfigs, postconfigs)
+    if grouped and os.name != "nt": os.setsid()
+    handler = signal.getsignal(signal.SIGTERM)
+    if callable(handler): signal.signal(signal.SIGTERM, lambda signum, frame: (reapGroups(), reapWorker(grouped), handler(signum, frame)))
+    return
+
+def reapWorker(grouped):
+    if grouped and os.name != "nt": os.killpg(os.getpid(), signal.SIGKILL)
+    return
+
+def pywork(path, cmd, section, verbose, debug, noexec, rem, cd, stream=None):
+    pheader = "{path} ({section})".format(path=path, section=section)
+    cheader = "{cmd}".format(cmd=cmd)
+    pyfunc = rcPython(verbose, debug, path, pyconfig[section])[cmd]
+    try:
+        with pd.pushd(cd): ec, out = pyfunc(verbose, debug, path, noexec, *rem)
+        pass
+    except Exception as exc:
+        ec = 1
+        out = tb.format_exc() if debug else "{name}: {exc}".format(name=type(exc).__name__, exc=exc)
+        pass
+    if stream: streamlines(stream, out)
+    return pheader, cheader, ec, out
+
+workprofiler = None
+def profiled(profiledir, function, *args):
+    global workprofiler
+    if workprofiler is None: workprofiler = cp.Profile()
+    workprofiler.enable()
+    try: return function(*args)
+    finally:
+        workprofiler.disable()
+        workprofiler.dump_stats(os.path.join(profiledir, "{pid}.prof".format(pid=os.getpid())))
+        pass
+    return
+
+def dumpProfile(profiler, filename, profiledir=None):
+    profiler.disable()
+    stats = pt.Stats(profiler)
+    if profiledir:
+        for name in sorted(os.listdir(profiledir)): stats.add(os.path.join(profiledir, name))
+        su.rmtree(profiledir, True)
+        pass
+    stats.dump_stats(filename)
+    return
+
+class executor:
+    def __init__(self, workers, shell="auto", config=(None, [], [], False)):
+        self.workers = workers
+        self.shell = shell
+        self.config = config
+        self.pypool = None
+        self.profiledir = None
+        return
+    def task(self, function, args):
+        if self.profiledir: return profiled, [self.profiledir, function] + args
+        return function, args
+    def python(self, path, cmd, section, verbose, debug, noexec, rem, cd, stream=None, timeout=0):
+        if self.pypool is None: self.pypool = pb.ProcessPool(max_workers=self.workers, initializer=pyinit, initargs=self.config)
+        function, args = self.task(pywork, [path, cmd, section, verbose, debug, noexec, rem, os.path.realpath(cd), stream])
+        future = self.pypool.schedule(function, args=args, timeout=timeout or None)
+        future.headers = ("{path} ({section})".format(path=path, section=section), cmd, timeout, stream)
+        return future
+    def close(self):
+        if self.pypool is None: return
+        self.pypool.close()
+        self.pypool.join()
+        return
+    pass
+
+class processExecutor(executor):
+    def __init__(self, workers, shell="auto", config=(None, [], [], False)):
+        super().__init__(workers, shell, config)
+        self.pool = self.pypool = pb.ProcessPool(max_workers=workers, initializer=pyinit, initargs=config)
+        return
+    def command(self, path, cmd, section, verbose, debug, noexec, cd=None, stream=None, policy=None, timeout=0):
+        if cd is None: function, args = self.task(work, [path, cmd, section, verbose, debug, noexec, stream, None, self.shell, policy, timeout])
+        else: function, args = self.task(cdwork, [path, cmd, section, verbose, debug, noexec, cd, stream, self.shell, policy, timeout])
+        return self.pool.schedule(function, args=args)
+    pass
+
+class threadExecutor(executor):
+    def __init__(self, workers, shell="auto", config=(None, [], [], False)):
+        super().__init__(workers, shell, config)
+        self.pool = cf.ThreadPoolExecutor(max_workers=workers)
+        return
+    def command(self, path, cmd, section, verbose, debug, noexec, cd=None, stream=None, policy=None, timeout=0):
+        cwd = None if cd is None else os.path.realpath(cd)
+        return self.pool.submit(work, path, cmd, section, verbose, debug, noexec, stream, cwd, self.shell, policy, timeout)
+    pass
+
+class asyncExecutor(executor):
+    def __init__(self, workers, shell="auto", config=(None, [], [], False)):
+        super().__init__(workers, shell, config)
+        self.loop = aio.new_event_loop()
+        self.semaphore = aio.Semaphore(workers)
+        th.Thread(target=self.loop.run_forever, daemon=True).start()
+        return
+    def command(self, path, cmd, section, verbose, debug, noexec, cd=None, stream=None, policy=None, timeout=0):
+        cwd = None if cd is None else os.path.realpath(cd)
+        coro = awork(path, cmd, section, verbose, debug, noexec, stream, cwd, self.shell, policy, timeout, self.semaphore)
+        return aio.run_coroutine_threadsafe(coro, self.loop)
+    pass
+
+executors = {
+    "process": processExecutor,
+    "thread": threadExecutor,
+    "async": asyncExecutor,
+}
+
 def tocolor(fcolor, colors, color):
     if not fcolor: return ""
     try: return colors[color]
@@ -71,40 +451,72 @@ def tocolor(fcolor, colors, color):
     except KeyError: pass
     return ""
 
-class pyfuncfuture:
-    def __init__(self, pheader, cheader, ec, out):
-        self.pheader = pheader
-        self.cheader = cheader
-        self.ec = ec
-        self.out = out
-        return
-    def done(self): return True
-    def cancel(self): return
-    def result(self): return self.pheader, self.cheader, self.ec, self.out
-    pass
-
 def HOME():
     if "HOME" in os.environ: return os.environ["HOME"]
     if "USERPROFILE" in os.environ: return os.environ["USERPROFILE"]
     if "HOMEDRIVE" in os.environ and "HOMEPATH" in os.environ: return "{}/{}".format(homedrive, homepath)
     return "NO HOME"
 
+def streamtag(color, colors, pheader):
+    if not color: return pheader
+    return tocolor(color, colors, "path") + pheader + Style.RESET_ALL
+
+def printOutput(prefix, out):
+    if type(out) != spilled:
+        print(prefix + out.strip())
+        return
+    with open(out.name, "rb") as ff, mmap.mmap(ff.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        start, end = 0, len(mm)
+        while start < end and mm[start:start + 1].isspace(): start += 1
+        while end > start and mm[end - 1:end].isspace(): end -= 1
+        decoder = cd.getincrementaldecoder("utf-8")("backslashreplace")
+        for pos in range(start, end, 1 << 20):
+            sys.stdout.write(prefix + decoder.decode(mm[pos:min(end, pos + (1 << 20))]))
+            continue
+        pass
+    print(prefix + decoder.decode(b"", final=True))
+    return
+
+def readOutput(out):
+    if type(out) != spilled: return out
+    with open(out.name, "rb") as ff: return ff.read().decode("utf-8", "backslashreplace")
+
+def jsonRecord(phase, future, pheader, cheader, ec, out):
+    work = getattr(future, "job", None)
+    path, section = work.meta if work and work.meta else (pheader, None)
+    start, end = (work.started, work.ended) if work else (None, None)
+    duration = end - start if work else None
+    record = dict(phase=phase, path=path, section=section, command=cheader, ec=ec, output=readOutput(out), start=start, end=end, duration=duration, cached=getattr(future, "cached", False), stage=getattr(future, "stage", None))
+    print(json.dumps(record))
+    sys.stdout.flush()
+    return
+
+def skipRecord(path, section, cmd):
+    print(json.dumps(dict(phase="skipped", path=path, section=section, command=cmd, ec=None, output="", start=None, end=None, duration=None, cached=False, stage=None)))
+    sys.stdout.flush()
+    return
+
 def display(verbose, color, colors, pheader, cheader, ec, out):
-    out = out.strip()
+    if type(out) != spilled: out = out.strip()
     if verbose >= 3:
         print(tocolor(color, colors, "path") + pheader, end="")
         print(" ", end="")
         print(tocolor(color, colors, "command") + cheader)
         pass
     if verbose >= 2 and len(out):
-        if ec: print(tocolor(color, colors, "bad") + out)
-        else: print(tocolor(color, colors, "good") + out)
+        if ec: printOutput(tocolor(color, colors, "bad"), out)
+        else: printOutput(tocolor(color, colors, "good"), out)
         pass
     return
 
 def genParser():
     fc = lambda prog: ap.RawDescriptionHelpFormatter(prog, max_help_position=36, width=120)
     parser = ap.ArgumentParser(description="walks filesystem executing arbitrary commands", formatter_class=fc)
+    parser.add_argument("--cache", help="result cache file", type=str)
+    parser.add_argument("--cachesize", help="maximum entries in the result cache", type=int)
+    parser.add_argument("--changedsince", help="only run in folders changed since CHANGEDSINCE", type=timestamp)
+    parser.add_argument("--changedsincelast", help="only run in folders changed since the last run", action="store_true", default=None)
+    parser.add_argument("--changedfile", help="file of folder fingerprints for --changedsincelast", type=str)
     parser.add_argument("--chdir", help="chdir first", action="append")
     parser.add_argument("--color", help="enables colorized output", action="store_true", default=None)
     parser.add_argument("--comment", help="ignored", action="append")
@@ -117,11 +529,18 @@ def genParser():
     parser.add_argument("--dump", help="dump section", action="append")
     parser.add_argument("--dumpall", help="dump all sections", action="store_true", default=None)
     parser.add_argument("--enable", help="enable section", action="append")
+    parser.add_argument("--executor", help="executor for commands", choices=sorted(executors))
     parser.add_argument("--file", help="file with folder names", action="append")
+    parser.add_argument("--format", help="output format", choices=["jsonl", "text"])
     parser.add_argument("--hashed", help="check hashes of unknown files", action="store_true", default=None)
     parser.add_argument("--ignore", help="ignore folder names", action="append")
+    parser.add_argument("--index", help="discovery index file", type=str)
     parser.add_argument("--invert", help="invert error codes", action="store_true", default=None)
     parser.add_argument("--make", help="make folders", action="store_true", default=None)
+    parser.add_argument("--makeburst", help="make calls allowed at once per host", type=int)
+    parser.add_argument("--makeinflight", help="make calls running at once per host", type=int)
+    parser.add_argument("--maxoutput", help="maximum bytes of output kept per command", type=int)
+    parser.add_argument("--mirror", help="mirror cache folder for make", type=str)
     parser.add_argument("--nocolor", help="disables colorized output", action="store_true", default=None)
     parser.add_argument("--noenable", help="no longer enable any sections", action="store_true", default=None)
     parser.add_argument("--noexec", help="do not actually execute", action="store_true", default=None)
@@ -129,24 +548,52 @@ def genParser():
     parser.add_argument("--nohashed", help="do not check hashes of unknown files", action="store_true", default=None)
     parser.add_argument("--noignore", help="ignore ignore options", action="store_true", default=None)
     parser.add_argument("--nomake", help="do not make folders", action="store_true", default=None)
+    parser.add_argument("--noprune", help="descend into folders with a section", action="store_true", default=None)
     parser.add_argument("--norecurse", help="do not recurse into subfolders", action="store_true", default=None)
+    parser.add_argument("--nostop", help="run all stages of a folder after errors", action="store_true", default=None)
+    parser.add_argument("--nostream", help="display output after all commands finish", action="store_true", default=None)
+    parser.add_argument("--outputdir", help="folder for full command outputs", type=str)
     parser.add_argument("--postconfig", help="postconfig option", action="append")
     parser.add_argument("--preconfig", help="preconfig option", action="append")
+    parser.add_argument("--profile", help="write a cProfile pstats file", type=str)
+    parser.add_argument("--profileworkers", help="merge profiles of worker processes", action="store_true", default=None)
+    parser.add_argument("--prune", help="do not descend into folders with a section", action="store_true", default=None)
+    parser.add_argument("--py:cacheable", dest="pycacheable", help="key for py:cacheable", type=str)
     parser.add_argument("--py:closebrace", dest="pyclosebrace", help="key for py:closebrace", type=str)
+    parser.add_argument("--py:concurrency", dest="pyconcurrency", help="key for py:concurrency", type=str)
     parser.add_argument("--py:enable", dest="pyenable", help="key for py:enable", type=str)
     parser.add_argument("--py:makecommand", dest="pymakecommand", help="key for py:makecommand", type=str)
     parser.add_argument("--py:makefunction", dest="pymakefunction", help="key for py:makefunction", type=str)
+    parser.add_argument("--py:markers", dest="pymarkers", help="key for py:markers", type=str)
+    parser.add_argument("--py:mirrorcommand", dest="pymirrorcommand", help="key for py:mirrorcommand", type=str)
     parser.add_argument("--py:openbrace", dest="pyopenbrace", help="key for py:openbrace", type=str)
     parser.add_argument("--py:priority", dest="pypriority", help="key for py:priority", type=str)
+    parser.add_argument("--py:timeout", dest="pytimeout", help="key for py:timeout", type=str)
     parser.add_argument("--recurse", help="recurse into subfolders", action="store_true", default=None)
+    parser.add_argument("--shell", help="run commands through the shell", choices=["always", "auto", "never"])
     parser.add_argument("--sleepcommand", help="sleep between command calls", type=float)
-    parser.add_argument("--sleepmake", help="sleep between make calls", type=float)
+    parser.add_argument("--sleepmake", help="sleep between make calls per host", type=float)
+    parser.add_argument("--spill", help="bytes of output kept in memory per command", type=int)
+    parser.add_argument("--stage", help="command run in each folder after the previous stage", action="append")
+    parser.add_argument("--stats", help="print run statistics", action="store_true", default=None)
+    parser.add_argument("--statsfile", help="write run statistics as JSON", type=str)
+    parser.add_argument("--statstop", help="number of slowest jobs in statistics", type=int)
+    parser.add_argument("--stop", help="stop the stages of a folder at its first error", action="store_true", default=None)
+    parser.add_argument("--stragglers", help="report commands still running every STRAGGLERS seconds", type=float)
+    parser.add_argument("--stream", help="stream tagged output lines as they arrive", action="store_true", default=None)
     parser.add_argument("--suppress", help="suppress repeated error output", action="store_true", default=None)
+    parser.add_argument("--timeout", help="seconds before a command is killed", type=float)
     parser.add_argument("--verbose", help="verbose level", type=int)
+    parser.add_argument("--walkers", help="number of folder scanning threads", type=int)
     parser.add_argument("--workers", help="number of workers", type=int)
     parser.add_argument("rest", nargs=ap.REMAINDER)
     return parser
 
+def timestamp(value):
+    try: return float(value)
+    except ValueError: pass
+    return dt.datetime.fromisoformat(value).timestamp()
+
 def option(*args):
     for arg in args:
         if arg is not None: return arg
@@ -159,37 +606,87 @@ futures = []
 def sighandler(signum, frame):
     global futures
     for future in futures: future.cancel()
+    reapGroups()
     sys.exit()
     return
 
-def waitFutures(verbose, debug, color, colors, discard, invert, futures):
+def tagSubmit(submit, **tags):
+    def run():
+        future = submit()
+        for name, value in tags.items(): setattr(future, name, value)
+        return future
+    return run
+
+def futureResult(future):
+    try: return future.result()
+    except cf.TimeoutError:
+        pheader, cheader, timeout, stream = future.headers
+        out = "[timed out after {timeout}s]".format(timeout=timeout)
+        if stream: streamline(stream, out)
+        return pheader, cheader, 124, out
+    pass
+
+def reportStragglers(color, colors, jobs):
+    eprint(tocolor(color, colors, "partition") + "<<< STRAGGLERS >>>")
+    for elapsed, label in jobs:
+        eprint(tocolor(color, colors, "errorcode") + "({elapsed:.0f}s)".format(elapsed=elapsed), tocolor(color, colors, "path") + label)
+        continue
+    return
+
+def waitFutures(verbose, debug, color, colors, discard, invert, futures, stream=False, stragglers=0, record=None):
     results = []
-    while True:
-        nfutures = []
-        for future in futures:
-            if future.done():
-                pheader, cheader, ec, out = future.result()
-                if verbose >= 5: display(verbose, color, colors, pheader, cheader, ec, out)
-                results.append((pheader, cheader, 0 if discard else (ec if not invert else not ec), out))
-                pass
-            else: nfutures.append(future)
-            continue
-        if len(nfutures) == 0: break
-        futures = nfutures
+    report = lambda jobs: reportStragglers(color, colors, jobs)
+    completed = futures.completed(stragglers, report) if hasattr(futures, "completed") else cf.as_completed(futures)
+    for future in completed:
+        pheader, cheader, ec, out = futureResult(future)
+        if record: record(future, pheader, cheader, ec, out)
+        if verbose >= 5 and not stream: display(verbose, color, colors, pheader, cheader, ec, out)
+        results.append((pheader, cheader, 0 if discard else (ec if not invert else not ec), out))
         continue
     return results
 
-def dispResults(verbose, debug, color, colors, partition, results):
+def dispResults(verbose, debug, color, colors, partition, results, stream=False):
     nerrors = 0
     if len(results):
-        if verbose >= 3: print(tocolor(color, colors, "partition") + partition)
+        if verbose >= 3 and not stream: print(tocolor(color, colors, "partition") + partition)
         for pheader, cheader, ec, out in results:
             if ec: nerrors += 1
-            display(verbose, color, colors, pheader, cheader, ec, out)
+            if not stream: display(verbose, color, colors, pheader, cheader, ec, out)
             continue
         pass
     return nerrors
 
+def stripPath(path):
+    if len(path) > 2 and (path[0:2] == "./" or path[0:2] == ".\\"): return path[2:]
+    return path
+
+def selectSection(verbose, debug, path, priorities, names=None):
+    if names is not None: names = set(names)
+    maxsection = (0, None)
+    for section, (priority, markers) in priorities.items():
+        if callable(priority):
+            with pd.pushd(path): pvalue = priority(verbose, debug, path)
+            pass
+        elif markers is None: pvalue = priority
+        else:
+            if names is None:
+                try: names = set(os.listdir(path))
+                except OSError: names = set()
+                pass
+            pvalue = priority if any(marker in names for marker in markers) else 0
+            pass
+        if pvalue > maxsection[0]:
+            maxsection = (pvalue, section)
+            pass
+        continue
+    return maxsection[1]
+
+def concurrencyLimits(section, key, concurrency):
+    if concurrency is None: return {}
+    if type(concurrency) != type({}): return {section: concurrency}
+    if key not in concurrency: return {}
+    return {"{section}:{key}".format(section=section, key=key): concurrency[key]}
+
 def readConfig(configfile, preconfigs=[], postconfigs=[]):
     rc = od.__dict__.copy()
     rc["HOME"] = HOME
@@ -204,30 +701,78 @@ def readConfig(configfile, preconfigs=[], postconfigs=[]):
         continue
     return rc
 
-def rcPython(verbose, debug, path, rc):
-    rc = rc.copy()
-    for key, value in rc.items():
-        if len(key) > 2 and key[:3] != "py:" and callable(value): rc[key] = value(verbose, debug, path)
-        continue
-    return rc
+def isLazy(key, value): return len(key) > 2 and key[:3] != "py:" and callable(value)
+
+class deferred:
+    def __init__(self, key): self.key = key
+    def __format__(self, spec): return "{{{key}:{spec}}}".format(key=self.key, spec=spec) if spec else str(self)
+    def __str__(self): return "{{{key}}}".format(key=self.key)
+    def __repr__(self): return "{{{key}!r}}".format(key=self.key)
+    pass
+
+class rcTemplate(cabc.Mapping):
+    def __init__(self, rc): self.rc = rc
+    def __getitem__(self, key):
+        value = self.rc[key]
+        if isLazy(key, value): return deferred(key)
+        return value
+    def __contains__(self, key): return key in self.rc
+    def __iter__(self): return iter(self.rc)
+    def __len__(self): return len(self.rc)
+    pass
+
+class rcLazy(cabc.Mapping):
+    def __init__(self, verbose, debug, path, rc):
+        self.verbose = verbose
+        self.debug = debug
+        self.path = path
+        self.rc = rc
+        self.values = {}
+        return
+    def __getitem__(self, key):
+        try: return self.values[key]
+        except KeyError: pass
+        value = self.rc[key]
+        if isLazy(key, value): value = self.values[key] = value(self.verbose, self.debug, self.path)
+        return value
+    def __contains__(self, key): return key in self.rc
+    def __iter__(self): return iter(self.rc)
+    def __len__(self): return len(self.rc)
+    pass
+
+def mirrorMake(mirrorcommand, mirror, verbose, debug, path, *rest): return mirrorcommand(verbose, debug, path, mirror, *rest)
+
+def rcPython(verbose, debug, path, rc): return rcLazy(verbose, debug, path, rc)
 
 def main():
-    global futures
+    global futures, pyconfig
     signal.signal(signalnum=signal.SIGINT, handler=signal.SIG_IGN)
     ca.init(autoreset=True)
     parser = genParser()
     try: onsub = os.environ["ONSUB"].split()
     except KeyError: onsub = []
     cmdargs = parser.parse_args(onsub + sys.argv[1:])
+    profiledir = tempfile.mkdtemp(prefix="onsubprofile") if cmdargs.profile and cmdargs.profileworkers else None
+    if cmdargs.profile:
+        profiler = cp.Profile()
+        profiler.enable()
+        atexit.register(dumpProfile, profiler, os.path.abspath(cmdargs.profile), profiledir)
+        pass
     homepy = f'{HOME()}/.onsub.py'
     if getattr(sys, "frozen", False): cmdname = sys.executable
     else: cmdname = __file__
     exepy = "{dir}/config/onsubdefaults.py".format(dir=os.path.realpath(os.path.dirname(cmdname)))
     configfile = option(cmdargs.configfile, homepy if os.path.exists(homepy) else (exepy if os.path.exists(exepy) else None))
-    rc = readConfig(configfile)
+    runstats = st.runStats()
+    with runstats.phase("config"): rc = readConfig(configfile)
     rcarguments = rc["arguments"] if "arguments" in rc else []
     rchashes = rc["hashes"] if "hashes" in rc else []
     fileargs = parser.parse_args(rcarguments)
+    cachefile = option(cmdargs.cache, fileargs.cache)
+    cachesize = option(cmdargs.cachesize, fileargs.cachesize, 10000)
+    changedsince = option(cmdargs.changedsince, fileargs.changedsince)
+    changedsincelast = option(cmdargs.changedsincelast, fileargs.changedsincelast, False)
+    changedfile = option(cmdargs.changedfile, fileargs.changedfile, os.path.join(HOME(), ".onsubchanged"))
     chdirs = option(cmdargs.chdir)
     color = option(cmdargs.color, optnot(cmdargs.nocolor), fileargs.color, optnot(fileargs.nocolor), True)
     count = option(cmdargs.count, fileargs.count, 10)
@@ -238,33 +783,80 @@ def main():
     dumps = cmdargs.dump or []
     dumpall = option(cmdargs.dumpall, False)
     enables = (cmdargs.enable or []) + (fileargs.enable or [])
+    executor = option(cmdargs.executor, fileargs.executor, "process")
     hashed = option(cmdargs.hashed, optnot(cmdargs.nohashed), fileargs.hashed, optnot(fileargs.nohashed), True)
+    indexfile = option(cmdargs.index, fileargs.index)
     invert = option(cmdargs.invert, False)
+    maxoutput = option(cmdargs.maxoutput, fileargs.maxoutput, 0)
     noenable = option(cmdargs.noenable, fileargs.noenable, False)
     noexec = option(cmdargs.noexec, fileargs.noexec, False)
     nofile = option(cmdargs.nofile, fileargs.nofile, False)
     files = (cmdargs.file or []) + (fileargs.file or []) if not nofile else []
+    fmt = option(cmdargs.format, fileargs.format, "text")
     noignore = option(cmdargs.noignore, fileargs.noignore, False)
     ignores = (cmdargs.ignore or []) + (fileargs.ignore or []) if not noignore else []
     make = option(cmdargs.make, optnot(cmdargs.nomake), fileargs.make, optnot(fileargs.nomake), False)
+    mirror = option(cmdargs.mirror, fileargs.mirror)
+    outputdir = option(cmdargs.outputdir, fileargs.outputdir)
+    makeburst = option(cmdargs.makeburst, fileargs.makeburst, 1)
+    makeinflight = option(cmdargs.makeinflight, fileargs.makeinflight, 0)
     preconfigs = option(cmdargs.preconfig, [])
+    prune = option(cmdargs.prune, optnot(cmdargs.noprune), fileargs.prune, optnot(fileargs.noprune), False)
     postconfigs = option(cmdargs.preconfig, [])
+    pycacheable = option(cmdargs.pycacheable, fileargs.pycacheable, "py:cacheable")
     pyclosebrace = option(cmdargs.pyclosebrace, fileargs.pyclosebrace, "%]")
+    pyconcurrency = option(cmdargs.pyconcurrency, fileargs.pyconcurrency, "py:concurrency")
     pyenable = option(cmdargs.pyenable, fileargs.pyenable, "py:enable")
     pymakecommand = option(cmdargs.pymakecommand, fileargs.pymakecommand, "py:makecommand")
     pymakefunction = option(cmdargs.pymakefunction, fileargs.pymakefunction, "py:makefunction")
+    pymarkers = option(cmdargs.pymarkers, fileargs.pymarkers, "py:markers")
+    pymirrorcommand = option(cmdargs.pymirrorcommand, fileargs.pymirrorcommand, "py:mirrorcommand")
     pyopenbrace = option(cmdargs.pyopenbrace, fileargs.pyopenbrace, "%[")
     pypriority = option(cmdargs.pypriority, fileargs.pypriority, "py:priority")
+    pytimeout = option(cmdargs.pytimeout, fileargs.pytimeout, "py:timeout")
     recurse = option(cmdargs.recurse, optnot(cmdargs.norecurse), fileargs.recurse, optnot(fileargs.norecurse), True)
+    shell = option(cmdargs.shell, fileargs.shell, "auto")
     sleepmake = option(cmdargs.sleepmake, fileargs.sleepmake, 0.1)
     sleepcommand = option(cmdargs.sleepcommand, fileargs.sleepcommand, 0)
+    spill = option(cmdargs.spill, fileargs.spill, 1 << 20)
+    stream = option(cmdargs.stream, optnot(cmdargs.nostream), fileargs.stream, optnot(fileargs.nostream), False)
+    stats = option(cmdargs.stats, fileargs.stats, False)
+    statsfile = option(cmdargs.statsfile, fileargs.statsfile)
+    statstop = option(cmdargs.statstop, fileargs.statstop, 10)
+    stop = option(cmdargs.stop, optnot(cmdargs.nostop), fileargs.stop, optnot(fileargs.nostop), False)
+    stragglers = option(cmdargs.stragglers, fileargs.stragglers, 0)
     suppress = option(cmdargs.suppress, fileargs.suppress, False)
+    timeout = option(cmdargs.timeout, fileargs.timeout, 0)
     verbose = option(cmdargs.verbose, fileargs.verbose, 4)
+    if fmt == "jsonl": verbose, stream = 0, False
+    walkers = option(cmdargs.walkers, fileargs.walkers, min(32, mp.cpu_count() + 4))
     workers = option(cmdargs.workers, fileargs.workers, mp.cpu_count())
     rest = cmdargs.rest
-    noop = True if not dumpall and len(dumps) == 0 and len(rest) < 1 else False
+    stages = [sl.split(stage) for stage in option(cmdargs.stage, []) if len(sl.split(stage))] + ([rest] if len(rest) else [])
+    pipeline = " | ".join(" ".join(stage) for stage in stages)
+    noop = True if not dumpall and len(dumps) == 0 and len(stages) < 1 else False
     if not chdirs: chdirs = [ "." ]
 
+    owd = os.getcwd()
+    if outputdir: outputdir = os.path.join(owd, outputdir)
+    if mirror: mirror = os.path.abspath(os.path.join(owd, os.path.expanduser(mirror)))
+    if statsfile: statsfile = os.path.join(owd, statsfile)
+    resultcache = ch.resultCache(os.path.join(owd, cachefile), cachesize) if cachefile else None
+    changestate = ch.changeState(os.path.join(owd, os.path.expanduser(changedfile))) if changedsincelast else None
+    def recorder(phase):
+        def record(future, pheader, cheader, ec, out):
+            if fmt == "jsonl": jsonRecord(phase, future, pheader, cheader, ec, out)
+            runstats.job(phase, future, pheader, ec)
+            if resultcache and not stream and ec == 0 and type(out) == str and hasattr(future, "cachekey"): resultcache.put(*future.cachekey, ec, out)
+            if changestate and hasattr(future, "changekey"):
+                if ec == 0: changestate.put(future.changekey, ch.worktree(future.job.meta[0])[0])
+                else: changestate.drop(future.changekey)
+                pass
+            return
+        return record
+    tmpdir = tempfile.mkdtemp(prefix="onsub")
+    atexit.register(su.rmtree, tmpdir, True)
+    policy = (maxoutput, spill, tmpdir, None)
     nerrors = 0
     for chdir in chdirs:
         with pd.pushd(chdir) as ctx:
@@ -274,7 +866,7 @@ def main():
                 if not os.path.exists(file): error(256 - 1, 'Input file "{file}" does not exist'.format(file=file))
                 hd = hl.sha256(open(file).read().encode()).hexdigest()
                 if hashed and hd not in rchashes: error(256 - 2, 'Input file "{file}" does not have allowed hash ({hd})'.format(file=file, hd=hd))
-                rc = readConfig(file, preconfigs, postconfigs)
+                with runstats.phase("config"): rc = readConfig(file, preconfigs, postconfigs)
                 for section in rc:
                     if section in ["python_path", "futures"]: continue
                     rcsection = rc[section]
@@ -287,9 +879,14 @@ def main():
 
             if recurse:
                 def pathIterate(ignores):
-                    for root, dirs, files in os.walk(".", followlinks=True, topdown=True):
-                        dirs[:] = [d for d in dirs if d not in ignores]
-                        yield root, None, None
+                    select = runstats.wrap("selection", lambda path, names: selectSection(verbose, debug, stripPath(path), priorities, names))
+                    index = None
+                    if indexfile:
+                        sections = [[section] if callable(priority) else [section, priority, sorted(markers) if markers is not None else None] for section, (priority, markers) in sorted(priorities.items())]
+                        signature = [pypriority, pymarkers, sections, sorted(ignores)]
+                        index = dc.Index(os.path.join(owd, indexfile), os.getcwd(), signature)
+                        pass
+                    yield from dc.walk(".", ignores, depth, prune, select, walkers, index)
                     return
                 pass
             else:
@@ -304,9 +901,12 @@ def main():
                     continue
                 return
 
-            rc = readConfig(configfile, preconfigs, postconfigs)
+            with runstats.phase("config"): rc = readConfig(configfile, preconfigs, postconfigs)
             colors = rc["colors"]
             priorities = {}
+            cacheables = {}
+            concurrencies = {}
+            timeouts = {}
             dumpFound = False
             for section, vv in rc.items():
                 if section == "colors" or section == "__builtins__": continue
@@ -328,95 +928,178 @@ def main():
                 if ((noenable or not defenable) and not enable) or disable: continue
                 try: priority = rcsection[pypriority]
                 except KeyError: error(256 - 3, 'No {pypriority} key in {section} section'.format(pypriority=pypriority, section=section))
-                priorities[section] = priority
+                priorities[section] = (priority, rcsection.get(pymarkers))
+                timeouts[section] = rcsection.get(pytimeout, timeout)
+                if type(timeouts[section]) not in (type(0), type(0.0)): error(256 - 14, 'Invalid {pytimeout} key in {section} section'.format(pytimeout=pytimeout, section=section))
+                cacheables[section] = rcsection.get(pycacheable, [])
+                if type(cacheables[section]) not in (type([]), type(())): error(256 - 15, 'Invalid {pycacheable} key in {section} section'.format(pycacheable=pycacheable, section=section))
+                concurrency = concurrencies[section] = rcsection.get(pyconcurrency)
+                if concurrency is None: continue
+                if type(concurrency) != type({}): concurrency = {None: concurrency}
+                if not all(type(limit) == type(0) for limit in concurrency.values()): error(256 - 13, 'Invalid {pyconcurrency} key in {section} section'.format(pyconcurrency=pyconcurrency, section=section))
                 continue
             if len(dumps) > 0:
                 if not dumpFound: error(256 - 4, "No matching sections found")
                 return 0
 
-            pool = pb.ProcessPool(max_workers=workers)
+            templates = {}
+            def prepare(section, n):
+                stage = stages[n]
+                if len(stage[0]) > 2 and stage[0][:3] == "py:":
+                    if stage[0] not in rc[section]: error(256 - 8, 'No "{cmd}" key in section {section}'.format(cmd=stage[0], section=section))
+                    return
+                if (section, n) in templates: return
+                command = stage[0]
+                if command[0] == "\\": command = command[1:]
+                elif command in rc[section]: command = "{{{command}}}".format(command=command)
+                with runstats.phase("substitution"): templates[section, n] = compileTemplate(" ".join([command] + stage[1:]), rc[section], count)
+                return
+            entries = list(fileIterate(ignores)) if make else []
+            makepaths = set(path for path, section, entry in entries if section in priorities)
+            for path, section, entry in entries:
+                if section not in priorities:
+                    if not noop and path not in makepaths and not os.path.isdir(path): error(256 - 7, 'Folder "{path}" does not exist.'.format(path=path))
+                    continue
+                rcsection = rc[section]
+                if not (mirror and pymirrorcommand in rcsection) and pymakecommand not in rcsection and pymakefunction not in rcsection: error(256 - 6, 'No "{pymakecommand}" or "{pymakefunction}" key in section {section}'.format(pymakecommand=pymakecommand, pymakefunction=pymakefunction, section=section))
+                if noop or (depth >= 0 and path.count(os.path.sep) >= depth): continue
+                for n in range(len(stages)): prepare(section, n)
+                continue
+
+            pyconfig = rc
+            pool = executors[executor](workers, shell, (configfile, preconfigs, postconfigs, any(timeouts.values())))
+            pool.profiledir = profiledir
             signal.signal(signal.SIGINT, sighandler)
 
+            start = time.perf_counter()
+            futures = sc.scheduler(1 / sleepmake if sleepmake > 0 else 0, makeburst, workers)
+            futures.limit("", 1 / sleepcommand if sleepcommand > 0 else 0)
+            making = set()
             for path, section, entry in fileIterate(ignores):
                 if not make: continue
                 if not entry: entry = tuple()
                 if section not in priorities: continue
                 rcsection = rcPython(verbose, debug, path, rc[section])
-                makefunction = makecommand = None
-                try: makecommand = rcsection[pymakecommand]
-                except KeyError:
-                    try: makefunction = rcsection[pymakefunction]
-                    except: error(256 - 6, 'No "{pymakecommand}" or "{pymakefunction}" key in section {section}'.format(pymakecommand=pymakecommand, pymakefunction=pymakefunction, section=section))
-                    pass
-                time.sleep(sleepmake)
+                if mirror and pymirrorcommand in rcsection: makecommand = ft.partial(mirrorMake, rcsection[pymirrorcommand], mirror)
+                else: makecommand = rcsection.get(pymakecommand)
+                pheader = "{path} ({section})".format(path=path, section=section)
                 if makecommand:
                     cmd = makecommand(verbose, debug, path, *entry)
                     if not cmd: continue
                     cmd = substitute(cmd, rcsection, pyopenbrace, pyclosebrace, count)
-                    future = pool.schedule(work, args=[path, cmd, section, verbose, debug, noexec])
+                    limits = concurrencyLimits(section, pymakecommand, concurrencies[section])
+                    host = sc.urlHost(entry[0]) if len(entry) and type(entry[0]) == type("") else ""
+                    if host: limits["host:" + host] = makeinflight
+                    submit = lambda path=path, cmd=cmd, section=section, pheader=pheader: pool.command(path, cmd, section, verbose, debug, noexec, None, opt(stream, streamtag(color, colors, pheader)), policy, timeouts[section])
+                    futures.add(tagSubmit(submit, stage=None), limits, host or None, "{pheader} {cmd}".format(pheader=pheader, cmd=cmd), (path, section))
                     pass
                 else:
-                    ec, out = makefunction(verbose, debug, path, noexec, *entry)
-                    future = pyfuncfuture(path, makefunction.__name__, ec, out)
+                    limits = concurrencyLimits(section, pymakefunction, concurrencies[section])
+                    submit = lambda path=path, section=section, entry=entry, pheader=pheader: pool.python(path, pymakefunction, section, verbose, debug, noexec, list(entry), ".", opt(stream, streamtag(color, colors, pheader)), timeouts[section])
+                    futures.add(tagSubmit(submit, stage=None), limits, None, "{pheader} {cmd}".format(pheader=pheader, cmd=pymakefunction), (path, section))
                     pass
-                futures.append(future)
+                making.add((path, section))
                 continue
-            results = waitFutures(verbose, debug, color, colors, discard, invert, futures)
-            futures = []
-            nerrors += dispResults(verbose, debug, color, colors, "<<< MAKE >>>", results)
-            if noop: return nerrors
 
-            root = os.getcwd()
-            futures = []
-            errors = []
-            if len(files) > 0: cmdIterate = fileIterate
-            else: cmdIterate = pathIterate
-            for path, fsection, _ in cmdIterate(ignores):
+            skipped = []
+            def schedule(path, section, n, changekey=None, failed=False):
+                stage = stages[n]
+                prepare(section, n)
+                rcsection = rcPython(verbose, debug, path, rc[section])
+                limits = concurrencyLimits(section, stage[0], concurrencies[section])
+                pheader = "{path} ({section})".format(path=path, section=section)
+                if len(stage[0]) > 2 and stage[0][:3] == "py:":
+                    cmd = stage[0]
+                    submit = lambda path=path, cmd=cmd, section=section, pheader=pheader: pool.python(path, cmd, section, verbose, debug, noexec, stage[1:], path, opt(stream, streamtag(color, colors, pheader)), timeouts[section])
+                    pass
+                else:
+                    with runstats.phase("substitution"): cmd = substitute(templates[section, n], rcsection, pyopenbrace, pyclosebrace, count)
+                    outname = "{section}.out".format(section=section) if len(stages) == 1 else "{section}.{n}.out".format(section=section, n=n + 1)
+                    keep = opt(outputdir, os.path.join(outputdir or "", path, outname))
+                    submit = lambda path=path, cmd=cmd, section=section, pheader=pheader, keep=keep: pool.command(path, cmd, section, verbose, debug, noexec, path, opt(stream, streamtag(color, colors, pheader)), policy[:3] + (keep,), timeouts[section])
+                    pass
+                label = "{pheader} {cmd}".format(pheader=pheader, cmd=cmd)
+                tags = dict(stage=n, pipeline=(changekey, failed))
+                if changestate and n == len(stages) - 1 and not failed: tags["changekey"] = changekey
+                submit = tagSubmit(submit, **tags)
+                fp = ch.fingerprint(path) if resultcache and not noexec and stage[0] in cacheables[section] else None
+                if fp is not None:
+                    key = ch.key(path, section, " ".join(stage) if cmd == stage[0] else cmd)
+                    hit = resultcache.get(key, fp)
+                    if hit:
+                        future = cf.Future()
+                        future.set_result((pheader, cmd) + tuple(hit))
+                        future.cached = True
+                        for name, value in tags.items(): setattr(future, name, value)
+                        if stream: streamlines(streamtag(color, colors, pheader), hit[1])
+                        futures.finished(future, label, (path, section))
+                        return
+                    submit = tagSubmit(submit, cachekey=(key, fp))
+                    pass
+                futures.add(submit, limits, "", label, (path, section))
+                return
+            record, recordmake = recorder("command"), recorder("make")
+            order = []
+            made = [start]
+            def advance(future, pheader, cheader, ec, out):
+                order.append(future.stage)
+                if future.stage is None:
+                    recordmake(future, pheader, cheader, ec, out)
+                    made[0] = time.perf_counter()
+                    making.discard(future.job.meta)
+                    if not noop and os.path.isdir(future.job.meta[0]): visit(*future.job.meta)
+                    return
+                record(future, pheader, cheader, ec, out)
+                changekey, failed = future.pipeline
+                failed = failed or ec != 0
+                if future.stage + 1 < len(stages) and not (stop and ec): schedule(*future.job.meta, future.stage + 1, changekey, failed)
+                elif changestate and changekey and failed: changestate.drop(changekey)
+                return
+            def visit(path, fsection):
                 if not os.path.isdir(path): error(256 - 7, 'Folder "{path}" does not exist.'.format(path=path))
                 nsep = path.count(os.path.sep)
-                if depth >= 0 and nsep >= depth: continue
-                if len(path) > 2 and (path[0:2] == "./" or path[0:2] == ".\\"): path = path[2:]
+                if depth >= 0 and nsep >= depth: return
+                path = stripPath(path)
                 if fsection:
                     section = fsection
-                    if section not in priorities: continue
+                    if section not in priorities: return
                     pass
                 else:
-                    maxsection = (0, "")
-                    for section, priority in priorities.items():
-                        with pd.pushd(path): pvalue = priority(verbose, debug, path)
-                        if pvalue > maxsection[0]:
-                            maxsection = (pvalue, section)
-                            pass
-                        continue
-                    if maxsection[0] == 0: continue
-                    section = maxsection[1]
-                    pass
-                rcsection = rcPython(verbose, debug, path, rc[section])
-                time.sleep(sleepcommand)
-                if len(rest) > 0 and len(rest[0]) > 2 and rest[0][:3] == "py:":
-                    cmd = rest[0]
-                    rem = rest[1:]
-                    pheader = "{path} ({section})".format(path=path, section=section)
-                    cheader = "{cmd}".format(cmd=cmd)
-                    try: pyfunc = rcsection[cmd]
-                    except KeyError: error(256 - 8, 'No "{cmd}" key in section {section}'.format(cmd=cmd, section=section))
-                    with pd.pushd(path): ec, out = pyfunc(verbose, debug, path, noexec, *rem)
-                    future = pyfuncfuture(pheader, cheader, ec, out)
-                    if verbose >= 6: display(verbose, color, colors, pheader, cheader, ec, out)
+                    with runstats.phase("selection"): section = selectSection(verbose, debug, path, priorities)
+                    if not section: return
                     pass
-                else:
-                    command = rest[0]
-                    if command[0] == "\\": command = command[1:]
-                    elif command in rcsection: command = "{{{command}}}".format(command=command)
-                    cmd = substitute(" ".join([command] + rest[1:]), rcsection, pyopenbrace, pyclosebrace, count)
-                    future = pool.schedule(cdwork, args=[path, cmd, section, verbose, debug, noexec, path])
+                changekey = None
+                if changedsince is not None or changestate:
+                    digest, newest = ch.worktree(path)
+                    changekey = ch.key(path, section, pipeline)
+                    if (changedsince is not None and newest <= changedsince) or (changestate and not changestate.changed(changekey, digest)):
+                        skipped.append("{path} ({section})".format(path=path, section=section))
+                        if fmt == "jsonl": skipRecord(path, section, pipeline)
+                        return
                     pass
-                futures.append(future)
+                schedule(path, section, 0, changekey)
+                return
+            if len(files) > 0: cmdIterate = fileIterate
+            else: cmdIterate = pathIterate
+            for path, fsection, _ in runstats.iterate("discovery", cmdIterate(ignores) if not noop else [], ["selection"]):
+                if (path, fsection) not in making: visit(path, fsection)
                 continue
-            results = waitFutures(verbose, debug, color, colors, discard, invert, futures)
+            results = waitFutures(verbose, debug, color, colors, discard, invert, futures, stream, stragglers, advance)
             futures = []
+            pool.close()
+            runstats.add("make", made[0] - start)
+            runstats.add("command", time.perf_counter() - start)
+            with runstats.phase("display"): nerrors += dispResults(verbose, debug, color, colors, "<<< MAKE >>>", [result for stage, result in zip(order, results) if stage is None], stream)
+            if noop: break
+            results = [result for stage, result in zip(order, results) if stage is not None]
+            order = [stage for stage in order if stage is not None]
 
-            nerrors += dispResults(verbose, debug, color, colors, "<<< RESULTS >>>", results)
+            start = time.perf_counter()
+            if len(stages) == 1: nerrors += dispResults(verbose, debug, color, colors, "<<< RESULTS >>>", results, stream)
+            for n, stage in enumerate(stages if len(stages) > 1 else []):
+                partition = "<<< RESULTS {n}: {stage} >>>".format(n=n + 1, stage=" ".join(stage))
+                nerrors += dispResults(verbose, debug, color, colors, partition, [result for nn, result in zip(order, results) if nn == n], stream)
+                continue
             if not suppress and verbose >= 1 and nerrors > 0:
                 print(tocolor(color, colors, "partition") + "<<< ERRORS >>>")
                 for pheader, cheader, ec, out in results:
@@ -426,16 +1109,33 @@ def main():
                     print(tocolor(color, colors, "path") + pheader, end="")
                     print(" ", end="")
                     print(tocolor(color, colors, "command") + cheader)
-                    if len(out): print(tocolor(color, colors, "error") + out.strip())
+                    if len(out): printOutput(tocolor(color, colors, "error"), out)
                     continue
                 pass
+            if verbose >= 3 and len(skipped):
+                print(tocolor(color, colors, "partition") + "<<< SKIPPED >>>")
+                if verbose >= 5:
+                    for pheader in skipped: print(tocolor(color, colors, "path") + pheader)
+                    pass
+                else: print("{n} unchanged folders".format(n=len(skipped)))
+                pass
+            runstats.add("display", time.perf_counter() - start)
             pass
         continue
 
+    if stats:
+        eprint(tocolor(color, colors, "partition") + "<<< STATS >>>")
+        for line in runstats.summary(statstop): eprint(line)
+        pass
+    if statsfile: runstats.dump(statsfile, statstop)
+    if resultcache: resultcache.save()
+    if changestate: changestate.save()
+    if nerrors >= 240:
+        eprint("Errors reached 240")
+        nerrors = 240
+        pass
     return nerrors
 
 if __name__ == "__main__":
     mp.freeze_support()
-    rv = main()
-    if rv >= 244: print("Errors exceed 244", file=sys.stderr)
-    sys.exit(rv)
+    sys.exit(main())
@@ -0,0 +1,143 @@
+import collections as cl
+import concurrent.futures as cf
+import re, time
+import urllib.parse as up
+
+def urlHost(url):
+    if "://" in url: return up.urlsplit(url).hostname or ""
+    mm = re.match(r"^(?:[^@/]+@)?([^:/]{2,}):", url)
+    if mm: return mm.group(1)
+    return ""
+
+class tokenBucket:
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.tokens = self.burst
+        self.stamp = time.monotonic()
+        return
+    def take(self):
+        if self.rate <= 0: return 0
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+    pass
+
+class job:
+    def __init__(self, submit, limits=None, bucket=None, label="", meta=None):
+        self.submit = submit
+        self.limits = limits if limits is not None else {}
+        self.bucket = bucket
+        self.label = label
+        self.meta = meta
+        self.queued = time.time()
+        self.started = self.ended = None
+        return
+    def run(self):
+        self.started = time.time()
+        future = self.submit()
+        future.job = self
+        future.add_done_callback(self.done)
+        return future
+    def done(self, future):
+        self.ended = time.time()
+        return
+    pass
+
+class scheduler:
+    def __init__(self, rate=0, burst=1, workers=0):
+        self.rate = rate
+        self.burst = burst
+        self.workers = workers
+        self.pending = cl.deque()
+        self.running = {}
+        self.done = cl.deque()
+        self.inflight = cl.Counter()
+        self.buckets = {}
+        return
+    def __iter__(self): return iter(list(self.running))
+    def add(self, submit, limits=None, bucket=None, label="", meta=None):
+        self.poll()
+        work = job(submit, limits, bucket, label, meta)
+        if self.start(work) is not None: self.pending.append(work)
+        return
+    def limit(self, bucket, rate, burst=1):
+        self.buckets[bucket] = tokenBucket(rate, burst)
+        return
+    def finished(self, future, label="", meta=None):
+        work = job(None, None, None, label, meta)
+        work.started = work.ended = work.queued
+        future.job = work
+        self.done.append(future)
+        return
+    def full(self): return self.workers > 0 and len(self.running) >= self.workers
+    def allowed(self, limits): return all(cap <= 0 or self.inflight[name] < cap for name, cap in limits.items())
+    def start(self, work):
+        if self.full() or not self.allowed(work.limits): return 0
+        if work.bucket is not None:
+            if work.bucket not in self.buckets: self.buckets[work.bucket] = tokenBucket(self.rate, self.burst)
+            delay = self.buckets[work.bucket].take()
+            if delay > 0: return delay
+            pass
+        for name in work.limits: self.inflight[name] += 1
+        self.running[work.run()] = work
+        return None
+    def finish(self, future):
+        work = self.running.pop(future)
+        if work.ended is None: work.ended = time.time()
+        for name in work.limits: self.inflight[name] -= 1
+        self.done.append(future)
+        return
+    def poll(self):
+        finished = [future for future in self.running if future.done()]
+        for future in finished: self.finish(future)
+        if len(finished) and len(self.pending): self.dispatch()
+        return
+    def dispatch(self):
+        wait = None
+        blocked = set()
+        npending = cl.deque()
+        while len(self.pending) and not self.full():
+            work = self.pending.popleft()
+            delay = 0 if work.bucket in blocked else self.start(work)
+            if delay is None: continue
+            if delay > 0:
+                blocked.add(work.bucket)
+                wait = delay if wait is None else min(wait, delay)
+                pass
+            npending.append(work)
+            continue
+        npending.extend(self.pending)
+        self.pending = npending
+        return wait
+    def stragglers(self, age):
+        now = time.time()
+        return sorted((now - work.started, work.label) for work in self.running.values() if now - work.started >= age)
+    def completed(self, every=0, report=None):
+        due = time.monotonic() + every
+        while len(self.pending) or len(self.running) or len(self.done):
+            while len(self.done):
+                yield self.done.popleft()
+                continue
+            wait = self.dispatch()
+            if every and report:
+                now = time.monotonic()
+                if now >= due:
+                    jobs = self.stragglers(every)
+                    if len(jobs): report(jobs)
+                    due = now + every
+                    pass
+                wait = min(wait, due - now) if wait else due - now
+                pass
+            if not len(self.running):
+                if wait: time.sleep(wait)
+                continue
+            done, _ = cf.wait(list(self.running), timeout=wait, return_when=cf.FIRST_COMPLETED)
+            for future in done: self.finish(future)
+            continue
+        return
+    pass
@@ -0,0 +1,83 @@
+import json, math, time
+import contextlib as cx
+
+phases = ["config", "make", "discovery", "selection", "substitution", "command", "display"]
+
+def percentile(values, pct):
+    if not len(values): return 0.0
+    values = sorted(values)
+    return values[max(0, math.ceil(pct / 100 * len(values)) - 1)]
+
+def distribution(values):
+    dist = dict(("p{pct}".format(pct=pct), percentile(values, pct)) for pct in (50, 90, 99))
+    dist["max"] = max(values) if len(values) else 0.0
+    dist["total"] = sum(values)
+    return dist
+
+class runStats:
+    def __init__(self):
+        self.phases = {}
+        self.jobs = []
+        return
+    def add(self, name, seconds):
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+        return
+    @cx.contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try: yield
+        finally: self.add(name, time.perf_counter() - start)
+        return
+    def wrap(self, name, function):
+        def timed(*args, **kwargs):
+            with self.phase(name): return function(*args, **kwargs)
+            pass
+        return timed
+    def iterate(self, name, iterable, inner=()):
+        iterator = iter(iterable)
+        while True:
+            nested = sum(self.phases.get(other, 0.0) for other in inner)
+            start = time.perf_counter()
+            item = next(iterator, iterator)
+            elapsed = time.perf_counter() - start
+            self.add(name, elapsed - (sum(self.phases.get(other, 0.0) for other in inner) - nested))
+            if item is iterator: return
+            yield item
+            continue
+        return
+    def job(self, phase, future, pheader, ec):
+        work = getattr(future, "job", None)
+        if not work: return
+        path, section = work.meta or (pheader, None)
+        self.jobs.append(dict(phase=phase, path=path, section=section, label=work.label, ec=ec, wait=work.started - work.queued, exec=work.ended - work.started, cached=getattr(future, "cached", False)))
+        return
+    def data(self, top):
+        data = dict(phases=self.phases)
+        for phase in sorted(set(job["phase"] for job in self.jobs)):
+            jobs = [job for job in self.jobs if job["phase"] == phase]
+            data[phase] = dict(count=len(jobs), cached=len([job for job in jobs if job["cached"]]), wait=distribution([job["wait"] for job in jobs]), exec=distribution([job["exec"] for job in jobs]))
+            continue
+        data["slowest"] = sorted(self.jobs, key=lambda job: job["exec"], reverse=True)[:top]
+        data["jobs"] = self.jobs
+        return data
+    def dump(self, filename, top):
+        with open(filename, "w") as ff: json.dump(self.data(top), ff, indent=1)
+        return
+    def summary(self, top):
+        data = self.data(top)
+        order = sorted(self.phases, key=lambda phase: phases.index(phase) if phase in phases else len(phases))
+        lines = ["{phase:<12} {seconds:10.3f}s".format(phase=phase, seconds=self.phases[phase]) for phase in order]
+        for phase in ("make", "command"):
+            if phase not in data: continue
+            lines.append("{phase} jobs: {count} ({cached} cached)".format(phase=phase, **data[phase]))
+            for kind in ("wait", "exec"):
+                dist = data[phase][kind]
+                lines.append("  {kind:<5} p50 {p50:8.3f}s p90 {p90:8.3f}s p99 {p99:8.3f}s max {max:8.3f}s total {total:10.3f}s".format(kind=kind, **dist))
+                continue
+            continue
+        if len(data["slowest"]): lines.append("slowest:")
+        for job in data["slowest"]:
+            lines.append("  {exec:8.3f}s ({ec}) {label}".format(**job))
+            continue
+        return lines
+    pass
@@ -0,0 +1,120 @@
+import os, time
+import subprocess as sp
+import gitstate as gs
+
+def run(argv):
+    try: proc = sp.run(argv, stdout=sp.PIPE, stderr=sp.DEVNULL)
+    except OSError: return 127, ""
+    return proc.returncode, proc.stdout.decode("utf-8", "backslashreplace")
+
+def count(argv): return run(argv)[1].count("\n")
+
+usage = "[--local] [--nofetch] [--fetched SECONDS]"
+
+def checkArgs(rest):
+    local, fetch, age = False, True, 0
+    args = list(rest)
+    while len(args):
+        arg = args.pop(0)
+        if arg == "--local": local = True
+        elif arg == "--nofetch": fetch = False
+        elif arg == "--fetched" and len(args): age = float(args.pop(0))
+        else: raise ValueError('unknown check argument "{arg}"'.format(arg=arg))
+        continue
+    return local, fetch, age
+
+def suggest(path, counts, key):
+    comment = ",".join("{name}={n}".format(name=name, n=n) for name, n in counts)
+    return 'onsub --chdir {path} --depth 1 --comment "{comment}" {{{key}}}'.format(path=path, comment=comment, key=key)
+
+def classify(path, nst, nsh, nin=None, nout=None, get="get", download="download"):
+    if nin is None:
+        counts = [("wc", nst), ("sh", nsh)]
+        if nst > 0: return 1, suggest(path, counts, "put")
+        if nsh > 0: return 2, suggest(path, counts, "unstow")
+        return 0, "[no local mods]"
+    counts = [("wc", nst), ("sh", nsh), ("out", nout), ("in", nin)]
+    if nin > 0 and nout == 0: return 3, suggest(path, counts, get)
+    if nout > 0 and nin == 0:
+        if nst > 0: return 4, suggest(path, counts, "put-upload")
+        return 5, suggest(path, counts, "upload")
+    if nout > 0 and nin > 0:
+        if nst > 0: return 6, suggest(path, counts, "download-get")
+        return 7, suggest(path, counts, download)
+    if nst > 0: return 8, suggest(path, counts, "put")
+    if nsh > 0: return 9, suggest(path, counts, "unstow")
+    return 0, "[no local mods, no repository changes]"
+
+def fetchedWithin(age):
+    if age <= 0: return False
+    try: gitdir, commondir = gs.gitDirs(".")
+    except gs.unsupported: return False
+    stamps = [os.path.getmtime(os.path.join(base, "FETCH_HEAD")) for base in {gitdir, commondir} if os.path.exists(os.path.join(base, "FETCH_HEAD"))]
+    return len(stamps) > 0 and time.time() - max(stamps) < age
+
+def gitStatus():
+    ec, out = run(["git", "status", "--porcelain=v2", "--show-stash"])
+    if ec != 0:
+        ec, out = run(["git", "status", "--porcelain=v2"])
+        out += "# stash {n}\n".format(n=count(["git", "stash", "list", "--pretty=oneline"]))
+        pass
+    heads, nst = {}, 0
+    for line in out.splitlines():
+        if line.startswith("# "):
+            name, _, value = line[2:].partition(" ")
+            heads[name] = value
+            pass
+        elif len(line): nst += 1
+        continue
+    return heads, nst
+
+def gitcheck(verbose, debug, path, noexec, *rest):
+    if noexec: return 0, "[noexec] gitcheck"
+    if not os.path.exists(".git"): return 0, "[not a git clone]"
+    local, fetch, age = checkArgs(rest)
+    if not local and fetch and not fetchedWithin(age): run(["git", "fetch"])
+    heads, nst = gitStatus()
+    nsh = int(heads.get("stash", 0))
+    if local: return classify(path, nst, nsh)
+    ec, out = run(["git", "rev-list", "--left-right", "--count", "origin/master...HEAD"])
+    nin, nout = map(int, out.split()) if ec == 0 else (0, 0)
+    return classify(path, nst, nsh, nin, nout)
+
+def hgShelves():
+    shelved = os.path.join(".hg", "shelved")
+    if not os.path.isdir(shelved): return 0
+    return len([name for name in os.listdir(shelved) if name.endswith(".patch")])
+
+def hgcheck(verbose, debug, path, noexec, *rest):
+    if noexec: return 0, "[noexec] hgcheck"
+    if not os.path.exists(".hg"): return 0, "[not an hg clone]"
+    local, fetch, age = checkArgs(rest)
+    nst = count(["hg", "status", "-q"])
+    nsh = hgShelves()
+    if local: return classify(path, nst, nsh)
+    nin = count(["hg", "in", "-q"]) if fetch else 0
+    nout = count(["hg", "out", "-q"]) if fetch else 0
+    return classify(path, nst, nsh, nin, nout, "download-get", "download-get")
+
+def svnStatus(remote):
+    ec, out = run(["svn", "status", "-q"] + (["-u"] if remote else []))
+    nst = nin = 0
+    for line in out.splitlines():
+        if len(line) < 9 or line.startswith("Status against revision"): continue
+        if line[0] != " ": nst += 1
+        if remote and line[8:10] == "* ": nin += 1
+        continue
+    return nst, nin
+
+def svncheck(verbose, debug, path, noexec, *rest):
+    if noexec: return 0, "[noexec] svncheck"
+    if not os.path.exists(".svn"): return 0, "[not an svn clone]"
+    local, fetch, age = checkArgs(rest)
+    nst, nin = svnStatus(not local and fetch)
+    if local:
+        if nst > 0: return 1, suggest(path, [("wc", nst)], "put-upload")
+        return 0, "[no local mods]"
+    counts = [("wc", nst), ("in", nin)]
+    if nin > 0: return 2, suggest(path, counts, "download-get")
+    if nst > 0: return 3, suggest(path, counts, "put-upload")
+    return 0, "[no local mods, no repository changes]"